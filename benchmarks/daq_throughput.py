@@ -0,0 +1,109 @@
+"""
+Acquisition throughput of Device.stream -> AnalogDaq -> DataStore against the pty simulator.
+
+The simulator runs in a forked process, so the CPU load reported here is the load of the
+acquisition side only. Linux/macOS only. Run from the repository root:
+    python -m benchmarks.daq_throughput [--drate]
+With --drate the process CPU is measured at every ADC data rate of DRATE_CODES (frame rate =
+SPS / N_CHANNELS)
+for the blocking reads of Device.stream and for a read loop which does not block
+(stream_latency 0, one frame per read), like the former busy-spin on in_waiting.
+"""
+import argparse
+import multiprocessing
+from time import monotonic, process_time, sleep
+import numpy as np
+from controllers.DietrichSimulator import DietrichSimulator
+from controllers.Dietrich import N_CHANNELS
+from model.daq import AnalogDaq, DRATE_CODES
+from model.experiment import DataStore
+
+FRAME_RATES = [1875, 6250, 12500, 25000, 50000, 100000, 200000]
+DURATION = 3.
+STREAM_MODES = {
+    "busy-spin": {"latency": 0, "min_batch_frames": 1},
+    "blocking": {},
+}
+
+
+def run_simulator(simulator: DietrichSimulator, stop_event, results):
+    simulator.start()
+    stop_event.wait()
+    simulator.stop()
+    results.put((simulator.sent_frames, simulator.dropped_frames))
+
+
+def run(frame_rate: float, duration: float = DURATION, stream_params: dict | None = None) -> dict:
+    ctx = multiprocessing.get_context("fork")
+    simulator = DietrichSimulator(frame_rate=frame_rate)
+    stop_event, results = ctx.Event(), ctx.Queue()
+    process = ctx.Process(target=run_simulator, args=(simulator, stop_event, results))
+    process.start()
+
+    daq = AnalogDaq(simulator.port)
+    daq.initialize()
+    daq.set_stream_params(**(stream_params or {}))
+    data_store = DataStore('V')
+    daq.add_stream_listener(data_store.listen)
+    daq.start_stream()
+    sleep(0.5)
+    n0, cpu0, t0 = len(data_store), process_time(), monotonic()
+    sleep(duration)
+    n1, cpu1, t1 = len(data_store), process_time(), monotonic()
+    daq.stop_stream()
+    stats = daq.get_stream_stats()
+    stop_event.set()
+    sent, dropped = results.get()
+    process.join()
+    daq.finalize()
+
+    stored = data_store.V_hall
+    return {
+        "frame_rate": frame_rate,
+        "stored_rate": (n1 - n0) / (t1 - t0),
+        "cpu": (cpu1 - cpu0) / (t1 - t0),
+        "sent": sent,
+        "dropped_at_device": dropped,
+        "lost_frames": stats["lost_frames"],
+        "corrupt_frames": stats["corrupt_frames"],
+        "loss": stats["lost_frames"] / max(1, stats["lost_frames"] + np.count_nonzero(~np.isnan(stored))),
+        "queue_max_depth": stats["queue_max_depth"],
+    }
+
+
+def drate_sweep(duration: float = DURATION):
+    print(f"{'SPS':>7} " + " ".join(f"{mode:>10}" for mode in STREAM_MODES) + f" {'stored/s':>10} {'lost':>6}  note")
+    for drate in DRATE_CODES:
+        frame_rate = float(drate) / N_CHANNELS
+        try:
+            results = [run(frame_rate, duration, stream_params=params) for params in STREAM_MODES.values()]
+        except OSError as e:
+            print(f"{drate:>7}  not measured: {e}")
+            continue
+        notes = []
+        n_stored = min(r["stored_rate"] for r in results) * duration
+        if n_stored < 10:
+            notes.append(f"only ~{n_stored:.0f} frames in the {duration:.0f} s window, stored/s is not meaningful")
+        dropped = sum(r["dropped_at_device"] for r in results)
+        if dropped:
+            notes.append(f"the simulator dropped {dropped:,} frames (pty full)")
+        print(f"{drate:>7} " + " ".join(f"{r['cpu'] * 100:>9.1f}%" for r in results)
+              + f" {results[-1]['stored_rate']:>10,.1f} {sum(r['lost_frames'] for r in results):>6}  "
+              + "; ".join(notes))
+
+
+def main():
+    print(f"{'frames/s':>9} {'SPS':>8} {'stored/s':>10} {'CPU':>7} {'lost':>8} {'loss':>7} {'corrupt':>8} {'max queue':>9}")
+    for frame_rate in FRAME_RATES:
+        r = run(frame_rate)
+        print(f"{frame_rate:>9,} {frame_rate * N_CHANNELS:>8,} {r['stored_rate']:>10,.0f} {r['cpu'] * 100:>6.1f}% "
+              f"{r['lost_frames']:>8,} {r['loss'] * 100:>6.2f}% {r['corrupt_frames']:>8} {r['queue_max_depth']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--drate", action="store_true", help="CPU at the ADC data rates, blocking vs. busy-spin")
+    if parser.parse_args().drate:
+        drate_sweep()
+    else:
+        main()
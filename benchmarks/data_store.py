@@ -0,0 +1,118 @@
+"""
+Memory and ingest CPU of the column DataStore compared to the former per-sample list appends.
+
+The batches are the simulator signal (triangular B ramps at 1875 frames/s), in batches of the
+minimum stream read (64 frames) and of a read at a high rate. Besides the columns the store keeps
+the plot pyramid and it tracks the ramps and bins the signals on ingest, which the legacy lists did
+not do. The batches are queued and processed in blocks (AbstractDataStore.STAGE_BLOCK), so this
+work costs the same per sample for small and large batches. The queued rest is processed at the
+end of a run and timed with it. The memory is the 12 bytes per sample of the columns plus their
+unused capacity (below ~6 % of a long run) and the pyramid levels (~0.1 bytes per sample).
+The ingest time is the best of alternating runs of both stores: on a shared machine the speed
+drifts by tens of percent within minutes, only the ratio is meaningful.
+
+Run from the repository root:
+    python -m benchmarks.data_store
+"""
+import tracemalloc
+from time import perf_counter
+import numpy as np
+from controllers.DietrichSimulator import mfe_signal
+from model.experiment import CryoDataStore, DataStore, hall_to_B
+
+FRAME_RATE = 1875
+
+
+class LegacyCryoDataStore:
+    def __init__(self, power_type):
+        self.power_type = power_type
+        self.V_hall_list = []
+        self.magnet_B_list = []
+        self.oled_list = []
+        self.I_photo_list = []
+        self.temp_list = []
+        self.temp_sample_list = []
+        self.channel_list = []
+        self.current_channel = 3
+        self.temp = 300.0
+        self.temp_sample = 301.234
+
+    def listen(self, stream_data_list):
+        for stream_data in stream_data_list:
+            self.V_hall_list.append(stream_data[0])
+            self.magnet_B_list.append(hall_to_B(stream_data[0]))
+            self.I_photo_list.append(stream_data[2])
+            if self.power_type == 'V':
+                self.oled_list.append(stream_data[1])
+            elif self.power_type == 'I':
+                self.oled_list.append(stream_data[3])
+            self.channel_list.append(self.current_channel)
+            self.temp_list.append(self.temp)
+            self.temp_sample_list.append(self.temp_sample)
+
+
+class LegacyDataStore(LegacyCryoDataStore):
+    def listen(self, stream_data_list):
+        for stream_data in stream_data_list:
+            self.V_hall_list.append(stream_data[0])
+            self.magnet_B_list.append(hall_to_B(stream_data[0]))
+            self.I_photo_list.append(stream_data[2])
+            if self.power_type == 'V':
+                self.oled_list.append(stream_data[1])
+            elif self.power_type == 'I':
+                self.oled_list.append(stream_data[3])
+
+
+def new_store(store_type):
+    store = store_type('V')
+    store.current_channel, store.temp, store.temp_sample = 3, 300.0, 301.234
+    return store
+
+
+def ingest(store_type, batches):
+    store = new_store(store_type)
+    for batch in batches:
+        store.listen(batch)
+    if hasattr(store, 'process'):
+        store.process()  # the rest of the queued batches
+    return store
+
+
+def ingest_time(store_type, batches) -> float:
+    t0 = perf_counter()
+    store = ingest(store_type, batches)
+    elapsed = perf_counter() - t0
+    del store  # not timed
+    return elapsed
+
+
+def retained_memory(store_type, batches) -> int:
+    """The memory retained by the store after the run."""
+    tracemalloc.start()
+    store = ingest(store_type, batches)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store  # alive until measured
+    return retained
+
+
+def run(n_samples: int, batch_size: int, repeat: int = 5):
+    values = mfe_signal(np.arange(n_samples // batch_size * batch_size) / FRAME_RATE)
+    batches = np.split(values, len(values) // batch_size)
+    n = len(batches) * batch_size
+    print(f"{n:,} samples in batches of {batch_size}:")
+    for legacy_type, store_type in ((LegacyDataStore, DataStore), (LegacyCryoDataStore, CryoDataStore)):
+        # the best of alternating runs, the speed of a shared machine drifts
+        t_legacy, t = np.inf, np.inf
+        for _ in range(repeat):
+            t_legacy = min(t_legacy, ingest_time(legacy_type, batches))
+            t = min(t, ingest_time(store_type, batches))
+        m_legacy, m = retained_memory(legacy_type, batches), retained_memory(store_type, batches)
+        print(f"  {store_type.__name__:<14} legacy {n / t_legacy:>12,.0f} samples/s {m_legacy / 2**20:>7.1f} MiB | "
+              f"columns {n / t:>12,.0f} samples/s {m / 2**20:>6.1f} MiB | "
+              f"ingest {t_legacy / t:>4.1f}x, {m_legacy / m:>4.1f}x less memory")
+
+
+if __name__ == "__main__":
+    run(n_samples=1_000_000, batch_size=64)
+    run(n_samples=1_000_000, batch_size=1024)
@@ -0,0 +1,123 @@
+"""
+Fitting the candidate models of each effect of a ramp one after another compared to fitting them
+concurrently with the thread and process backends of get_fit_executor. The best models and their
+scores must be the same for all backends.
+
+Run from the repository root, with a measurement directory (data.mfeb or data.csv) and optionally
+a process config (default: processing/process_config.yaml, or the template):
+    python -m benchmarks.model_fitting [measurement_dir [process_config.yaml]] [--ramps N] [--workers N]
+Without a measurement a synthetic ramp with an OMC and a MEL dip is fitted.
+Finally the model groups are fitted with the process backend inside a ramp process pool, like
+process_measurement does with n_workers > 1, where the fits have to fall back to threads.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from time import perf_counter
+import numpy as np
+import yaml
+
+# the processing modules import each other as top level modules
+PROCESSING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "processing")
+sys.path.insert(0, PROCESSING_DIR)
+from fitting import lorentzian  # noqa: E402
+from omc_processing import (load_measurement, interpolate_gaps, ramps_from_measurement,  # noqa: E402
+                            remove_faulty_ramps, preprocess_ramp, fit_models, get_best_model,
+                            get_fit_executor, create_ramp_executor, shutdown_fit_executors,
+                            SAMPLING_RATE)
+
+LORENTZ_MODELS = ["double_non_lorentzian", "double_lorentzian", "lorentzian_non_lorentzian",
+                  "lorentzian", "non_lorentzian"]
+COLE_MODELS = ["cole", "double_cole"]
+
+
+def load_config(path: str | None) -> dict:
+    if path is None:
+        path = os.path.join(PROCESSING_DIR, "process_config.yaml")
+        if not os.path.isfile(path):
+            path = os.path.join(PROCESSING_DIR, "process_config_template.yaml")
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def measurement_tasks(path: str, config: dict, n_ramps: int) -> list[tuple]:
+    """(x, y, models_to_use, fit_score) of every effect and model group of the first n_ramps ramps."""
+    measurement = interpolate_gaps(load_measurement(path))
+    fs = measurement.attrs.get("sample_rate", SAMPLING_RATE)
+    ramps = remove_faulty_ramps(ramps_from_measurement(measurement))[:n_ramps]
+    fitting_config = config["ramp"]["fitting"]
+    tasks = []
+    for ramp in ramps:
+        ramp = preprocess_ramp(ramp.reset_index(), config, fs)
+        for effect_name in fitting_config["effects_to_fit"]:
+            effect_config = fitting_config[effect_name]
+            for models_to_use in effect_config["models"]:
+                if models_to_use:
+                    tasks.append((ramp["B"], ramp[f"{effect_name}_detrend"], models_to_use,
+                                  effect_config["fit_score"]))
+    return tasks
+
+
+def synthetic_tasks(n_ramps: int) -> list[tuple]:
+    B = np.linspace(-192, 192, 9000)
+    tasks = []
+    for _ in range(n_ramps):
+        y = lorentzian(B, 8., 3.) - lorentzian(B, 60., 1.) + np.random.normal(0, 0.02, len(B))
+        tasks += [(B, y, COLE_MODELS, "bic"), (B, y, LORENTZ_MODELS, "bic")]
+    return tasks
+
+
+def fit_task(task: tuple, executor) -> tuple:
+    x, y, models_to_use, fit_score = task
+    models = fit_models(x, y, models_to_use, executor=executor)
+    model, score = get_best_model(x, y, models, score=fit_score)
+    return model.name if model else None, score
+
+
+def run(tasks: list[tuple], backend: str, n_workers: int) -> tuple[float, list]:
+    executor = get_fit_executor({"executor": backend, "n_workers": n_workers})
+    if executor is not None:
+        # start the workers outside of the timing
+        executor.submit(int).result()
+    t0 = perf_counter()
+    best = [fit_task(task, executor) for task in tasks]
+    return perf_counter() - t0, best
+
+
+def fit_task_in_ramp_pool(task: tuple, n_workers: int) -> tuple:
+    executor = get_fit_executor({"executor": "process", "n_workers": n_workers})
+    assert isinstance(executor, ThreadPoolExecutor), "process backend in a ramp pool worker"
+    return fit_task(task, executor)
+
+
+def run_in_ramp_pool(tasks: list[tuple], n_workers: int, timeout: float = 600.) -> tuple[float, list]:
+    t0 = perf_counter()
+    with create_ramp_executor({"n_workers": max(n_workers, 2)}) as executor:
+        best = list(executor.map(fit_task_in_ramp_pool, tasks, repeat(n_workers), timeout=timeout))
+    return perf_counter() - t0, best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("measurement", nargs="?")
+    parser.add_argument("config", nargs="?")
+    parser.add_argument("--ramps", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    if args.measurement:
+        tasks = measurement_tasks(args.measurement, load_config(args.config), args.ramps)
+    else:
+        tasks = synthetic_tasks(args.ramps)
+    print(f"{len(tasks)} model groups, {args.workers} workers, {os.cpu_count()} CPUs")
+    t_serial, expected = run(tasks, "serial", args.workers)
+    print(f"serial  {t_serial:>7.2f} s")
+    for backend in ("thread", "process"):
+        t, best = run(tasks, backend, args.workers)
+        assert best == expected, f"{backend}: best models differ"
+        print(f"{backend:<7} {t:>7.2f} s, speedup {t_serial / t:.2f}x")
+    shutdown_fit_executors()
+    t, best = run_in_ramp_pool(tasks, args.workers)
+    assert best == expected, "process in ramp pool: best models differ"
+    print(f"process in ramp pool {t:>7.2f} s, speedup {t_serial / t:.2f}x")
@@ -0,0 +1,73 @@
+"""
+Post-fit evaluation of all dip models on one ramp: the former per-sample loop compared to
+evaluating the model and component functions on the whole array. The results agree to the last
+bit except for the rounding of NumPy's vectorized pow, which may differ by one ulp from the scalar
+one, the deviation relative to the amplitude of the curve is printed.
+
+Run from the repository root:
+    python -m benchmarks.model_predict
+"""
+import os
+import sys
+from time import perf_counter
+import numpy as np
+
+# the processing modules import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "processing"))
+from fitting import (ColeModel, DoubleColeModel, ColeLorentzianModel, NonLorentzianModel,  # noqa: E402
+                     DoubleNonLorentzianModel, LorentzianModel, DoubleLorentzianModel,
+                     LorentzianNonLorentzianModel, LorentzianColeModel, SOC_RISC_Model, ComposedDipModel,
+                     lorentzian)
+
+RAMP_SAMPLES = 9000  # one ramp of B = -192..192 mT
+
+
+def fitted_models(B: np.ndarray) -> list:
+    y = lorentzian(B, 8., 3.) - lorentzian(B, 60., 1.) + np.random.normal(0, 0.02, len(B))
+    models = [ColeModel(), DoubleColeModel(), ColeLorentzianModel(), NonLorentzianModel(),
+              DoubleNonLorentzianModel(), LorentzianModel(), DoubleLorentzianModel(),
+              LorentzianNonLorentzianModel(), LorentzianColeModel(), SOC_RISC_Model()]
+    for model in models:
+        model.fit(B, y)
+    return [model for model in models if model.fitted]
+
+
+def evaluate_loop(model, B: np.ndarray) -> list[np.ndarray]:
+    results = [np.array([model.f(x, *model.params) for x in B])]
+    if isinstance(model, ComposedDipModel) or isinstance(model, SOC_RISC_Model):
+        results += [np.array([function(x) for x in B]) for function in model.get_fitted_component_functions().values()]
+    return results
+
+
+def evaluate_vectorized(model, B: np.ndarray) -> list[np.ndarray]:
+    results = [model.predict(B)]
+    if isinstance(model, ComposedDipModel) or isinstance(model, SOC_RISC_Model):
+        results += [function(B) for function in model.get_fitted_component_functions().values()]
+    return results
+
+
+def run(n_samples: int):
+    B = np.linspace(-192, 192, n_samples)
+    models = fitted_models(B)
+    t0 = perf_counter()
+    loop = [evaluate_loop(model, B) for model in models]
+    t_loop = perf_counter() - t0
+    t0 = perf_counter()
+    vectorized = [evaluate_vectorized(model, B) for model in models]
+    t_vec = perf_counter() - t0
+    n_values = n_differ = 0
+    deviation = 0.
+    for expected, result in zip(loop, vectorized):
+        for e, r in zip(expected, result):
+            n_values += e.size
+            n_differ += np.count_nonzero(e != r)
+            deviation = max(deviation, np.max(np.abs(e - r)) / max(np.max(np.abs(e)), np.finfo(float).tiny))
+    assert deviation < 1e-14
+    print(f"{len(models)} models, {n_samples:>7} samples per ramp: loop {t_loop * 1e3:>9.1f} ms, "
+          f"vectorized {t_vec * 1e3:>7.2f} ms, speedup {t_loop / t_vec:>6.0f}x, "
+          f"{n_differ}/{n_values} values differ, max relative deviation {deviation:.1e}")
+
+
+if __name__ == "__main__":
+    for n_samples in (RAMP_SAMPLES // 10, RAMP_SAMPLES, RAMP_SAMPLES * 10):
+        run(n_samples)
@@ -9,7 +9,7 @@ class Stream_handler:
         self.ch01 = deque(maxlen=max_n_values)
         self.ch23 = deque(maxlen=max_n_values)
         self.ch45 = deque(maxlen=max_n_values)
-    def recieve_data(self, data: list[tuple[float, float, float]]):
+    def recieve_data(self, data: np.ndarray):
         for value_tuple in data:
             self.ch01.append(value_tuple[0])
             self.ch23.append(value_tuple[1])
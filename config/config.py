@@ -2,4 +2,12 @@ import os
 
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                            "experiment_config.yaml")
-DEBUG = False
\ No newline at end of file
+DEBUG = False
+# measurements are recorded here while streaming and moved to the save folder on save,
+# unsaved recordings (e.g. after a crash) stay here
+RECORDING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "recordings")
+# replay a recorded data.mfeb or data.csv instead of streaming from the DAQ, e.g. for GUI tuning.
+# Takes precedence over DEBUG for the DAQ, combine with DEBUG = True to use dummy instruments.
+REPLAY_FILE: str | None = None
+REPLAY_SPEED = 1.
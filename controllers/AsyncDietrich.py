@@ -0,0 +1,312 @@
+import asyncio
+import logging
+from collections import deque
+import numpy as np
+import serial
+from controllers.Dietrich import Device, FrameDecoder
+from controllers.stream_timing import StreamBatch, RateEstimator
+
+logger = logging.getLogger(__name__)
+
+
+class SerialTransport(asyncio.Transport):
+    """
+    Minimal asyncio transport for a pyserial port. The port is watched with loop.add_reader,
+    event loops without reader support (Windows proactor) poll in_waiting every poll_interval.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, protocol: asyncio.Protocol,
+                 serial_instance: serial.Serial, poll_interval: float = 0.005):
+        super().__init__()
+        self._loop = loop
+        self._protocol = protocol
+        self.serial = serial_instance
+        self.poll_interval = poll_interval
+        self._closing = False
+        self._poll_task: asyncio.Task | None = None
+        try:
+            loop.add_reader(self.serial.fileno(), self._read_ready)
+        except (NotImplementedError, AttributeError):
+            self._poll_task = loop.create_task(self._poll())
+        loop.call_soon(protocol.connection_made, self)
+
+    def _read_ready(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except serial.SerialException as exc:
+            self._close(exc)
+            return
+        if data:
+            self._protocol.data_received(data)
+
+    async def _poll(self):
+        while not self._closing:
+            if self.serial.in_waiting:
+                self._read_ready()
+            await asyncio.sleep(self.poll_interval)
+
+    def write(self, data: bytes) -> None:
+        # commands are a few bytes, the write timeout of the port bounds the time this blocks
+        self.serial.write(data)
+
+    def reset_input_buffer(self) -> None:
+        self.serial.reset_input_buffer()
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self) -> None:
+        self._close(None)
+
+    def _close(self, exc: Exception | None):
+        if self._closing:
+            return
+        self._closing = True
+        if self._poll_task:
+            self._poll_task.cancel()
+        else:
+            self._loop.remove_reader(self.serial.fileno())
+        self.serial.close()
+        self._loop.call_soon(self._protocol.connection_lost, exc)
+
+
+class DietrichProtocol(asyncio.Protocol):
+    """
+    Splits the received bytes into text lines (command answers) or, while streaming, decodes
+    them into StreamBatches. Batches wait in a bounded queue for the consumer, when it is full
+    the policy decides what happens (the event loop must not block):
+        coalesce: the batch is appended to the newest queued batch, nothing is lost
+        drop_oldest: the oldest queued batch is discarded
+    """
+    POLICIES = ("coalesce", "drop_oldest")
+
+    def __init__(self, buffer_size: int = 1 << 16, maxsize: int = 64, policy: str = "coalesce"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown queue policy {policy}. Use one of {self.POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.mode = "line"  # line, stream or discard
+        self.decoder = FrameDecoder(buffer_size)
+        self.rate_estimator = RateEstimator()
+        self.transport: asyncio.Transport | None = None
+        self.lines: asyncio.Queue[str] = asyncio.Queue()
+        self.closed = asyncio.Event()
+        self._rx = b""
+        self._batches: deque[StreamBatch | None] = deque()
+        self._ready = asyncio.Event()
+        self.reset_stream()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if exc:
+            logger.error(f"DAQ connection lost: {exc}")
+        self.end_stream()
+        self.closed.set()
+
+    def data_received(self, data: bytes):
+        if self.mode == "stream":
+            self._decode(memoryview(data))
+        elif self.mode == "line":
+            self._rx += data
+            while b"\n" in self._rx:
+                line, self._rx = self._rx.split(b"\n", 1)
+                self.lines.put_nowait(line.decode(Device.DEFAULTS["encoding"], errors="ignore").strip())
+
+    def _decode(self, data: memoryview):
+        while len(data):
+            free = self.decoder.writable()
+            n_bytes = min(len(free), len(data))
+            free[:n_bytes] = data[:n_bytes]
+            self.decoder.commit(n_bytes)
+            data = data[n_bytes:]
+            values = self.decoder.decode()
+            if len(values):
+                self._put(StreamBatch.stamp(values.copy(), self._frame_index))
+
+    def _put(self, batch: StreamBatch):
+        self._frame_index += len(batch)
+        self.rate_estimator.update(batch.t, batch.index, len(batch))
+        if len(self._batches) >= self.maxsize and self._batches[-1] is not None:
+            if self.policy == "coalesce":
+                self._batches[-1] = StreamBatch.concatenate(self._batches[-1], batch)
+                self.coalesced_batches += 1
+                return
+            dropped = self._batches.popleft()
+            self.dropped_batches += 1
+            self.dropped_frames += len(dropped)
+        self._batches.append(batch)
+        self._ready.set()
+
+    def reset_stream(self):
+        self.decoder.reset()
+        self.rate_estimator.reset()
+        self._batches.clear()
+        self._frame_index = 0
+        self.dropped_batches = 0
+        self.dropped_frames = 0
+        self.coalesced_batches = 0
+
+    def end_stream(self):
+        """Ends the batch iteration after the queued batches."""
+        self._batches.append(None)
+        self._ready.set()
+
+    async def get_batch(self) -> StreamBatch | None:
+        while not self._batches:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._batches.popleft()
+
+    def get_stats(self) -> dict:
+        return self.decoder.get_stats() | {
+            "queue_depth": len(self._batches),
+            "queue_size": self.maxsize,
+            "dropped_batches": self.dropped_batches,
+            "dropped_frames": self.dropped_frames,
+            "coalesced_batches": self.coalesced_batches,
+            "sample_rate": self.rate_estimator.rate,
+        }
+
+
+class AsyncDevice:
+    """
+    asyncio counterpart of Device, several devices and their consumers can share one event loop.
+
+    port is a serial port (a pty of DietrichSimulator works as well), a "socket://host:port" url
+    or None if a connected stream socket is given as sock. The stream is consumed with
+        async for batch in device.batches():
+    which ends when the stream is stopped.
+    """
+    DEFAULTS = Device.DEFAULTS | {
+        "batch_queue_size": 64,
+        "batch_queue_policy": "coalesce",
+        "stop_settle": 0.05,
+        "poll_interval": 0.005,
+    }
+
+    def __init__(self, port: str | None, sock=None):
+        self.port = port
+        self.sock = sock
+        self.transport: asyncio.Transport | None = None
+        self.protocol: DietrichProtocol | None = None
+        self.streaming = False
+
+    def _create_protocol(self) -> DietrichProtocol:
+        return DietrichProtocol(self.DEFAULTS["receive_buffer_size"], self.DEFAULTS["batch_queue_size"],
+                                self.DEFAULTS["batch_queue_policy"])
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        if self.sock is not None:
+            self.transport, self.protocol = await loop.create_connection(self._create_protocol, sock=self.sock)
+        elif self.port.startswith("socket://"):
+            host, _, port = self.port[len("socket://"):].rpartition(":")
+            self.transport, self.protocol = await loop.create_connection(self._create_protocol, host, int(port))
+        else:
+            rsc = serial.Serial(
+                port=self.port,
+                baudrate=self.DEFAULTS["baudrate"],
+                timeout=0,
+                write_timeout=self.DEFAULTS["write_timeout"],
+            )
+            self.protocol = self._create_protocol()
+            self.transport = SerialTransport(loop, self.protocol, rsc, self.DEFAULTS["poll_interval"])
+            await asyncio.sleep(0)  # connection_made
+
+    async def initialize(self):
+        await self.open()
+        await asyncio.sleep(0.5)  # on reset it may take some while for the ESP32 to wake up
+        self._clear_lines()
+        self.set_debug(False)
+        self.reset()
+
+    def _clear_lines(self):
+        while not self.protocol.lines.empty():
+            self.protocol.lines.get_nowait()
+
+    def writeMessage(self, message: str):
+        if not self.transport or self.transport.is_closing():
+            logger.warning("Connection not open")
+            return
+        message = message + self.DEFAULTS["write_termination"]
+        self.transport.write(message.encode(self.DEFAULTS["encoding"]))
+
+    async def query(self, message: str) -> str:
+        if not self.transport:
+            logger.warning("Connection not open")
+            return ""
+        self._clear_lines()
+        self.writeMessage(message)
+        try:
+            ans = await asyncio.wait_for(self.protocol.lines.get(), self.DEFAULTS["read_timeout"])
+        except asyncio.TimeoutError:
+            ans = ""
+        logger.debug(f"{message=}; {ans=}")
+        return ans
+
+    def set_debug(self, debug: bool):
+        self.writeMessage(f"SET DEBUG {int(debug)}")
+
+    def set_gain(self, gain: str):
+        self.writeMessage(f"SET GAIN {gain}")
+
+    def set_rate(self, sps: str):
+        self.writeMessage(f"SET DRATE {sps}")
+
+    async def idn(self) -> str:
+        return await self.query("IDN")
+
+    def reset(self) -> None:
+        self.writeMessage("RST")
+
+    async def get_analog_input(self, channel) -> float:
+        return float(await self.query(f"IN {channel}"))
+
+    async def start_stream(self):
+        if not self.transport:
+            logger.warning("Connection not open")
+            return
+        logger.info("Start Stream on AsyncDevice")
+        self.protocol.reset_stream()
+        self.protocol.mode = "stream"
+        self.writeMessage("START")
+        self.streaming = True
+
+    async def stop_stream(self):
+        if not self.transport:
+            logger.warning("Connection not open")
+            return
+        self.writeMessage("STOP")
+        self.streaming = False
+        # frames which are still underway are discarded, like Device does with reset_input_buffer
+        self.protocol.mode = "discard"
+        self.protocol.end_stream()
+        await asyncio.sleep(self.DEFAULTS["stop_settle"])
+        if isinstance(self.transport, SerialTransport):
+            self.transport.reset_input_buffer()
+        self.protocol.mode = "line"
+
+    async def batches(self):
+        """Async iterator over the StreamBatches of the running stream."""
+        while True:
+            batch = await self.protocol.get_batch()
+            if batch is None:
+                return
+            yield batch
+
+    def get_sample_rate(self) -> float:
+        return self.protocol.rate_estimator.rate if self.protocol else np.nan
+
+    def get_stream_stats(self) -> dict:
+        return self.protocol.get_stats() if self.protocol else {}
+
+    async def finalize(self):
+        if not self.transport:
+            return
+        if self.streaming:
+            await self.stop_stream()
+        self.set_debug(False)
+        self.transport.close()
+        await self.protocol.closed.wait()
+        self.transport = None
@@ -1,13 +1,167 @@
-import struct
 import serial
 import threading
 import logging
 from typing import Callable
+from functools import lru_cache
 from time import sleep
-import random
+import numpy as np
+from controllers.dispatcher import ListenerDispatcher
+from controllers.stream_timing import StreamBatch, RateEstimator
 
 logger = logging.getLogger(__name__)
-DeviceListener = Callable[[list[tuple[float, float, float, float]]], None]
+
+N_CHANNELS = 4
+VALUE_DTYPE = np.dtype("<f4")
+# Binary stream frame, see controllers/Dietrich/Dietrich.ino:
+# sync word, sequence counter, 4 floats and a Fletcher-16 checksum over counter and floats
+SYNC_BYTES = b"\xa5\x5a"
+FRAME_DTYPE = np.dtype([
+    ("sync", "<u2"),
+    ("seq", "<u2"),
+    ("values", VALUE_DTYPE, (N_CHANNELS,)),
+    ("checksum", "<u2"),
+])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+SYNC_WORD = int.from_bytes(SYNC_BYTES, "little")
+_CHECKED = slice(2, 4 + N_CHANNELS * VALUE_DTYPE.itemsize)
+
+DeviceListener = Callable[[np.ndarray], None]
+
+
+@lru_cache
+def _fletcher_weights(n_bytes: int) -> np.ndarray:
+    # closed form of the running sums: sum1 weights each byte with 1,
+    # sum2 with the number of bytes from it to the end
+    return np.stack([np.ones(n_bytes, dtype=np.uint32), np.arange(n_bytes, 0, -1, dtype=np.uint32)], axis=1)
+
+
+def fletcher16(data: np.ndarray) -> np.ndarray:
+    """Fletcher-16 checksum of each row of a (n, m) uint8 array."""
+    # both sums with a single product, the per call overhead dominates for short reads
+    sums = (data @ _fletcher_weights(data.shape[1])) % 255
+    return ((sums[:, 1] << 8) | sums[:, 0]).astype(np.uint16)
+
+
+def encode_frames(values: np.ndarray, first_seq: int = 0) -> bytes:
+    """Encodes (n, N_CHANNELS) values the way the firmware sends them."""
+    values = np.asarray(values, dtype=VALUE_DTYPE).reshape(-1, N_CHANNELS)
+    frames = np.empty(len(values), dtype=FRAME_DTYPE)
+    frames["sync"] = SYNC_WORD
+    frames["seq"] = (first_seq + np.arange(len(values))) % (1 << 16)
+    frames["values"] = values
+    raw = frames.view(np.uint8).reshape(-1, FRAME_SIZE)
+    frames["checksum"] = fletcher16(raw[:, _CHECKED])
+    return frames.tobytes()
+
+
+class FrameDecoder:
+    """
+    Decodes the framed binary ADC stream into (n, N_CHANNELS) float32 arrays.
+
+    Bytes are received into a preallocated buffer. All complete frames are checked and
+    decoded with a single np.frombuffer call; the incomplete tail is moved to the front
+    of the buffer on the next receive. The returned array may be a view into the receive
+    buffer and is only valid until the next call to writable().
+
+    A frame with a wrong sync word or checksum makes the decoder search for the next sync
+    word (resync). Gaps in the sequence counter are returned as NaN rows, so the sample
+    index of the stored data stays aligned with the acquisition time.
+    """
+    def __init__(self, buffer_size: int = 1 << 16):
+        self.buffer = bytearray(buffer_size)
+        self._view = memoryview(self.buffer)
+        self.fill = 0
+        self._decoded = 0
+        self.reset()
+
+    def writable(self) -> memoryview:
+        """Returns the free part of the receive buffer."""
+        if self._decoded:
+            tail = self.fill - self._decoded
+            self.buffer[:tail] = self.buffer[self._decoded:self.fill]
+            self.fill = tail
+            self._decoded = 0
+        return self._view[self.fill:]
+
+    def commit(self, n_bytes: int) -> None:
+        self.fill += n_bytes
+
+    def _find_sync(self, start: int) -> int | None:
+        data = np.frombuffer(self.buffer, dtype=np.uint8, count=self.fill)
+        candidates = np.flatnonzero((data[start:-1] == SYNC_BYTES[0]) & (data[start + 1:] == SYNC_BYTES[1]))
+        return start + int(candidates[0]) if len(candidates) else None
+
+    def decode(self) -> np.ndarray:
+        offset = 0
+        accepted = []
+        while (n_frames := (self.fill - offset) // FRAME_SIZE):
+            frames = np.frombuffer(self.buffer, dtype=FRAME_DTYPE, count=n_frames, offset=offset)
+            raw = np.frombuffer(self.buffer, dtype=np.uint8, count=n_frames * FRAME_SIZE, offset=offset)
+            raw = raw.reshape(n_frames, FRAME_SIZE)
+            valid = (frames["sync"] == SYNC_WORD) & (fletcher16(raw[:, _CHECKED]) == frames["checksum"])
+            n_valid = n_frames if valid.all() else int(np.argmin(valid))
+            if n_valid:
+                accepted.append(frames[:n_valid])
+                offset += n_valid * FRAME_SIZE
+                self._in_sync = True
+            if n_valid == n_frames:
+                break
+            if self._in_sync:
+                if frames["sync"][n_valid] == SYNC_WORD:
+                    self.corrupt_frames += 1
+                self.resyncs += 1
+                self._in_sync = False
+            next_sync = self._find_sync(offset + 1)
+            if next_sync is None:
+                # a trailing first sync byte may belong to the next frame
+                next_sync = self.fill - 1 if self.buffer[self.fill - 1] == SYNC_BYTES[0] else self.fill
+            self.skipped_bytes += next_sync - offset
+            offset = next_sync
+        self._decoded = offset
+        if not accepted:
+            return np.empty((0, N_CHANNELS), dtype=VALUE_DTYPE)
+        frames = accepted[0] if len(accepted) == 1 else np.concatenate(accepted)
+        return self._fill_gaps(frames)
+
+    def _fill_gaps(self, frames: np.ndarray) -> np.ndarray:
+        seq = frames["seq"]
+        first_seq, last_seq = int(seq[0]), int(seq[-1])
+        first_gap = 0 if self._last_seq is None else (first_seq - self._last_seq - 1) % (1 << 16)
+        self._last_seq = last_seq
+        if not first_gap and (last_seq - first_seq) % (1 << 16) == len(seq) - 1:
+            return frames["values"]  # consecutive counters, nothing lost
+        seq = seq.astype(np.int64)
+        gaps = np.empty(len(seq), dtype=np.int64)
+        gaps[0] = first_gap
+        gaps[1:] = (np.diff(seq) - 1) % (1 << 16)
+        n_lost = int(gaps.sum())
+        if not n_lost:
+            return frames["values"]
+        self.lost_frames += n_lost
+        logger.warning(f"{n_lost} frame(s) lost in the DAQ stream")
+        positions = np.arange(len(frames)) + np.cumsum(gaps)
+        values = np.full((len(frames) + n_lost, N_CHANNELS), np.nan, dtype=VALUE_DTYPE)
+        values[positions] = frames["values"]
+        return values
+
+    def reset(self) -> None:
+        self.fill = 0
+        self._decoded = 0
+        self._last_seq: int | None = None
+        self._in_sync = True
+        self.lost_frames = 0
+        self.corrupt_frames = 0
+        self.skipped_bytes = 0
+        self.resyncs = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "lost_frames": self.lost_frames,
+            "corrupt_frames": self.corrupt_frames,
+            "skipped_bytes": self.skipped_bytes,
+            "resyncs": self.resyncs,
+        }
+
 
 class Device:
     DEFAULTS = {
@@ -17,14 +171,27 @@ class Device:
         "baudrate": 250000,
         "read_timeout": 0.5,
         "write_timeout": 0.5,
+        "receive_buffer_size": 1 << 16,
+        # below ~64 frames per read the per call overhead of the decoder exceeds a per-frame loop.
+        # At the default 7500 SPS (1875 frames/s) a read of 64 frames takes 34 ms, the latency
+        # must not expire before (50 ms: ~94 frames, the plots still update at 20 Hz)
+        "stream_latency": 0.05,
+        "min_batch_frames": 64,
+        "dispatch_queue_size": 64,
+        "dispatch_policy": "block",
     }
 
     def __init__(self, port: str):
         self.port = port
         self.rsc = None
         self.streaming = False
-        self.listeners = []
-        self.stream_buffer = bytearray()
+        self.dispatcher = ListenerDispatcher(self.DEFAULTS["dispatch_queue_size"], self.DEFAULTS["dispatch_policy"])
+        self.decoder = FrameDecoder(self.DEFAULTS["receive_buffer_size"])
+        self.stream_latency = self.DEFAULTS["stream_latency"]
+        self.min_batch_frames = self.DEFAULTS["min_batch_frames"]
+        self.rate_estimator = RateEstimator()
+        self._frame_index = 0
+        self._stream_thread: threading.Thread | None = None
 
     def initialize(self):
         self.rsc = serial.Serial(
@@ -83,36 +250,63 @@ class Device:
         ans = self.query(message)
         return float(ans)
 
+    @property
+    def listeners(self) -> list[DeviceListener]:
+        return self.dispatcher.listeners
+
     def add_listener(self, listener: DeviceListener) -> None:
-        self.listeners.append(listener)
+        self.dispatcher.add_listener(listener)
 
     def remove_listener(self, listener: DeviceListener) -> None:
-        try:
-            self.listeners.remove(listener)
-        except ValueError:
-            pass
-
-    def notify_listeners(self, values: list[tuple[float, float, float, float]]):
-        for listener in self.listeners:
-            listener(values)
+        self.dispatcher.remove_listener(listener)
+
+    def notify_listeners(self, values: np.ndarray):
+        batch = StreamBatch.stamp(values, self._frame_index)
+        self._frame_index += len(batch)
+        self.rate_estimator.update(batch.t, batch.index, len(batch))
+        self.dispatcher.put(batch)
+
+    def get_sample_rate(self) -> float:
+        """Frame rate (= rate per channel) measured on the running stream, NaN before enough data."""
+        return self.rate_estimator.rate
+
+    def set_dispatch_policy(self, policy: str | None = None, queue_size: int | None = None):
+        self.dispatcher.configure(queue_size, policy)
+
+    def get_stream_stats(self) -> dict:
+        return self.dispatcher.get_stats() | self.decoder.get_stats() | {"sample_rate": self.get_sample_rate()}
+
+    def set_stream_params(self, latency: float | None = None, min_batch_frames: int | None = None):
+        """
+        latency: maximum time [s] a read blocks before the received frames are handed to the listeners
+        min_batch_frames: number of frames a read waits for, unless the latency expires first.
+            Smaller reads cost more CPU per frame, see benchmarks/frame_decoder.py
+        """
+        if latency is not None:
+            self.stream_latency = latency
+        if min_batch_frames is not None:
+            self.min_batch_frames = max(1, int(min_batch_frames))
 
     def stream(self):
         if not self.rsc:
             logger.warn("Serial not initialized")
             return
-        while self.streaming:
-            bytes_in_serial = self.rsc.in_waiting
-            if not bytes_in_serial:
-                continue
-            self.stream_buffer += self.rsc.read(bytes_in_serial)
-            n_bytes_package = 4*4 # 4 floats with 4 bytes each
-            n_complete_vals = len(self.stream_buffer) // (n_bytes_package) 
-            adc_values: list[tuple[float, float, float, float]] = []
-            for _ in range(n_complete_vals):
-                val_tuple = struct.unpack_from("ffff", self.stream_buffer[:n_bytes_package])
-                adc_values.append(val_tuple)
-                del self.stream_buffer[:n_bytes_package]
-            self.notify_listeners(adc_values)
+        # block in read() for at most stream_latency instead of polling in_waiting
+        self.rsc.timeout = self.stream_latency
+        min_batch_bytes = self.min_batch_frames * FRAME_SIZE
+        try:
+            while self.streaming:
+                free = self.decoder.writable()
+                n_request = min(max(self.rsc.in_waiting, min_batch_bytes), len(free))
+                n_read = self.rsc.readinto(free[:n_request])
+                if not n_read:
+                    continue
+                self.decoder.commit(n_read)
+                adc_values = self.decoder.decode()
+                if len(adc_values):
+                    self.notify_listeners(adc_values)
+        finally:
+            self.rsc.timeout = self.DEFAULTS["read_timeout"]
 
     def start_stream(self):
         if not self.rsc:
@@ -124,11 +318,16 @@ class Device:
         self.rsc.reset_input_buffer()
         self.writeMessage("START")
         self.streaming = True
-        self.stream_buffer = bytearray()
-        thread = threading.Thread(target=self.stream)
-        thread.start()
+        self.decoder.reset()
+        self.dispatcher.reset_stats()
+        self.rate_estimator.reset()
+        self._frame_index = 0
+        self.dispatcher.start()
+        self._stream_thread = threading.Thread(target=self.stream, daemon=True)
+        self._stream_thread.start()
 
     def get_true_samplerate(self, sample_time=5):
+        """Restarts the stream to count frames on the device, see get_sample_rate for the live estimate."""
         self.start_stream()
         sleep(sample_time)
         self.stop_stream()
@@ -145,6 +344,11 @@ class Device:
         message = "STOP"
         self.writeMessage(message)
         self.streaming = False
+        # the stream thread returns from read() within stream_latency
+        if self._stream_thread and self._stream_thread is not threading.current_thread():
+            self._stream_thread.join(timeout=self.stream_latency + self.DEFAULTS["read_timeout"])
+        self._stream_thread = None
+        self.dispatcher.stop()
         self.rsc.reset_input_buffer()
 
     def finalize(self):
@@ -162,14 +366,18 @@ class DummyDevice:
         "baudrate": 250000,
         "read_timeout": 0.5,
         "write_timeout": 0.5,
+        "dispatch_queue_size": 64,
+        "dispatch_policy": "block",
     }
 
     def __init__(self, port: str):
         self.port = port
         self.rsc = None
         self.streaming = False
-        self.listeners = []
-        self.stream_buffer = bytearray()
+        self.dispatcher = ListenerDispatcher(self.DEFAULTS["dispatch_queue_size"], self.DEFAULTS["dispatch_policy"])
+        self.rate_estimator = RateEstimator()
+        self._frame_index = 0
+        self._stream_thread: threading.Thread | None = None
 
     def initialize(self):
         logger.debug(f"Initializing device on port {self.port} with defaults: {self.DEFAULTS}")
@@ -190,6 +398,9 @@ class DummyDevice:
     def set_rate(self, sps: str):
         logger.debug(f"Setting data rate to: {sps}")
 
+    def set_stream_params(self, latency: float | None = None, min_batch_frames: int | None = None):
+        logger.debug(f"Setting stream params: {latency=}, {min_batch_frames=}")
+
     def idn(self):
         logger.debug("Fetching device ID")
         return "DummyDevice v1.0"
@@ -201,44 +412,62 @@ class DummyDevice:
         logger.debug(f"Getting analog input for channel: {channel}")
         return 0.0
 
+    @property
+    def listeners(self):
+        return self.dispatcher.listeners
+
     def add_listener(self, listener):
         logger.debug("Adding listener")
-        self.listeners.append(listener)
+        self.dispatcher.add_listener(listener)
 
     def remove_listener(self, listener):
-        try:
-            self.listeners.remove(listener)
-            logger.debug("Removed listener")
-        except ValueError:
-            logger.debug("Listener not found")
+        logger.debug("Removing listener")
+        self.dispatcher.remove_listener(listener)
+
+    def notify_listeners(self, values: np.ndarray):
+        batch = StreamBatch.stamp(values, self._frame_index)
+        self._frame_index += len(batch)
+        self.rate_estimator.update(batch.t, batch.index, len(batch))
+        self.dispatcher.put(batch)
+
+    def get_sample_rate(self) -> float:
+        """Frame rate (= rate per channel) measured on the running stream, NaN before enough data."""
+        return self.rate_estimator.rate
+
+    def set_dispatch_policy(self, policy: str | None = None, queue_size: int | None = None):
+        self.dispatcher.configure(queue_size, policy)
+
+    def get_stream_stats(self) -> dict:
+        return self.dispatcher.get_stats() | {"sample_rate": self.get_sample_rate()}
 
-    def notify_listeners(self, values: list[tuple[float, float, float, float]]):
-        for listener in self.listeners:
-            listener(values)
-        
 
     def stream(self):
         logger.debug("Starting dummy stream loop")
         while self.streaming:
-            num_tuples = random.randint(1, 10)  # Random amount of tuples
-            dummy_values = [
-                (random.uniform(0, 100), random.uniform(0, 100), random.uniform(0, 100), random.uniform(0, 100))
-                for _ in range(num_tuples)
-            ]
+            num_frames = np.random.randint(1, 11)  # Random amount of frames
+            dummy_values = np.random.uniform(0, 100, (num_frames, N_CHANNELS)).astype(VALUE_DTYPE)
             self.notify_listeners(dummy_values)
             sleep(1/100)
 
     def start_stream(self):
         logger.debug("Starting stream")
         self.streaming = True
-        thread = threading.Thread(target=self.stream)
-        thread.start()
+        self.dispatcher.reset_stats()
+        self.rate_estimator.reset()
+        self._frame_index = 0
+        self.dispatcher.start()
+        self._stream_thread = threading.Thread(target=self.stream, daemon=True)
+        self._stream_thread.start()
 
     def stop_stream(self):
         logger.debug("Stopping stream")
         message = "STOP"
         self.writeMessage(message)
         self.streaming = False
+        if self._stream_thread:
+            self._stream_thread.join()
+            self._stream_thread = None
+        self.dispatcher.stop()
 
     def get_true_samplerate(self, sample_time=5):
         logger.debug(f"Calculating true sample rate over {sample_time} seconds")
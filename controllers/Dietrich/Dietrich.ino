@@ -25,10 +25,24 @@ bool debug = true;
 SPIClass spi(HSPI);
 ADS1256 adc(DRDY_PIN, CLOCK_SPEED, ADC_V_REF, USE_RESET_PIN, spi, SCK_PIN, MISO_PIN, MOSI_PIN, ADC_CS_PIN);
 
+// Binary stream frame: sync word, sequence counter, values, Fletcher-16 checksum over seq and values.
+// The host uses the sync word to resynchronize and the counter to detect lost frames.
+const int N_CHANNELS = 4;
+const uint8_t SYNC_0 = 0xA5;
+const uint8_t SYNC_1 = 0x5A;
+
+struct __attribute__((packed)) Frame {
+  uint8_t sync[2];
+  uint16_t seq;
+  float values[N_CHANNELS];
+  uint16_t checksum;
+};
+
 long cycles = 0;
 unsigned long start_time, run_time;
 float debug_first, debug_last;
-float inVals[3]; // 01, 23, 45
+float inVals[N_CHANNELS]; // 01, 23, 45, 67
+Frame frame;
 
 bool sendingData = false;
 String cmd;
@@ -73,6 +87,7 @@ void resetDAC_ADC() {
 }
 
 void getAdcVals() {
+  // the conversion read belongs to the channel set in the previous step
   adc.waitDRDY();
   adc.setChannel(2,3);
   inVals[0] = adc.readCurrentChannel();
@@ -82,8 +97,31 @@ void getAdcVals() {
   inVals[1] = adc.readCurrentChannel();
 
   adc.waitDRDY();
-  adc.setChannel(0,1);
+  adc.setChannel(6,7);
   inVals[2] = adc.readCurrentChannel();
+
+  adc.waitDRDY();
+  adc.setChannel(0,1);
+  inVals[3] = adc.readCurrentChannel();
+}
+
+uint16_t fletcher16(const uint8_t *data, size_t len) {
+  uint16_t sum1 = 0;
+  uint16_t sum2 = 0;
+  for (size_t i = 0; i < len; i++) {
+    sum1 = (sum1 + data[i]) % 255;
+    sum2 = (sum2 + sum1) % 255;
+  }
+  return (sum2 << 8) | sum1;
+}
+
+void sendFrame() {
+  frame.sync[0] = SYNC_0;
+  frame.sync[1] = SYNC_1;
+  memcpy(frame.values, inVals, sizeof(frame.values));
+  frame.checksum = fletcher16((uint8_t *)&frame.seq, sizeof(frame.seq) + sizeof(frame.values));
+  Serial.write((byte *)&frame, sizeof(Frame));
+  frame.seq++;
 }
 
 void handleIDN() {
@@ -91,9 +129,9 @@ void handleIDN() {
 }
 
 void resetVals() {
-  inVals[0] = 0;
-  inVals[1] = 0;
-  inVals[2] = 0;
+  for (int i = 0; i < N_CHANNELS; i++) {
+    inVals[i] = 0;
+  }
 }
 
 void handleReset() {
@@ -109,7 +147,7 @@ void handleIn() {
     Serial.print(inVals[1], 6);
     Serial.println(inVals[2], 6);
   } else {
-    Serial.write((byte *)inVals, 3 * sizeof(float));
+    Serial.write((byte *)inVals, N_CHANNELS * sizeof(float));
   }
 
 }
@@ -148,10 +186,12 @@ void handleContinuousIn() {
     Serial.print(",");
     Serial.print(inVals[1], 6);
     Serial.print(",");
-    Serial.println(inVals[2], 6);
+    Serial.print(inVals[2], 6);
+    Serial.print(",");
+    Serial.println(inVals[3], 6);
     delay(10);
   } else {
-    Serial.write((byte *)inVals, 3 * sizeof(float)); //3 floats which 4 bytes each
+    sendFrame();
   }
   if (cycles==0) {
     debug_first = inVals[0];
@@ -184,6 +224,7 @@ void recieveCmd() {
     currentState = SET;
   } else if(cmd == "START") {
     cycles = 0;
+    frame.seq = 0;
     start_time = millis();
     currentState = CONTINUOUS_IN;
   } else if(cmd == "STOP") {
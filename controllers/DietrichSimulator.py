@@ -0,0 +1,196 @@
+import os
+import pty
+import tty
+import select
+import threading
+import logging
+from time import monotonic, sleep
+import numpy as np
+from controllers.Dietrich import N_CHANNELS, VALUE_DTYPE, encode_frames
+
+logger = logging.getLogger(__name__)
+
+# ADS1256 data rate register codes, see model/daq.py DRATE_CODES
+DRATE_SPS = {
+    3: 2.5, 19: 5, 35: 10, 51: 15, 67: 25, 83: 30, 99: 50, 114: 60, 130: 100,
+    146: 500, 161: 1000, 176: 2000, 192: 3750, 208: 7500, 224: 15000, 240: 25000,
+}
+
+
+def mfe_signal(t: np.ndarray, frequency: float = 0.1) -> np.ndarray:
+    """
+    Synthetic (n, N_CHANNELS) stream: triangular hall voltage and OLED/photo signals with a
+    Lorentzian dip around B = 0 plus noise.
+    """
+    phase = (t * frequency) % 1
+    v_hall = 0.18 * (2 * np.abs(2 * phase - 1) - 1)
+    B = 2.545442 - 1108.27859 * v_hall
+    dip = B**2 / (B**2 + 5**2)
+    values = np.empty((len(t), N_CHANNELS), dtype=VALUE_DTYPE)
+    values[:, 0] = v_hall
+    values[:, 1] = 1e-3 * (1 + 0.02 * dip)
+    values[:, 2] = 0.5 * (1 + 0.05 * dip)
+    values[:, 3] = 3.0 * (1 - 0.01 * dip)
+    values += np.random.normal(0, 1e-6, values.shape).astype(VALUE_DTYPE)
+    return values
+
+
+class DietrichSimulator:
+    """
+    Emulates the Dietrich DAQ firmware on a pseudo terminal (POSIX only).
+
+    The slave side of the pty is available as self.port, so the real Device class can be
+    used unchanged. Alternatively the simulator serves an existing file descriptor, e.g. one
+    end of socket.socketpair() for AsyncDevice(None, sock=...).
+    Supported commands: IDN, RST, SET DRATE/GAIN/DEBUG, START, STOP, NUM.
+    While streaming, frames are written in the binary frame format of the firmware at
+    the rate given by SET DRATE (all channels are multiplexed, so the frame rate is
+    sps / N_CHANNELS) or at frame_rate, if given. Frames which do not fit into the pty
+    buffer are dropped like on an overflowing UART, which the host sees as sequence gaps.
+    """
+    IDN = "Here is Heinrich with 24 Bit ADC and 16 Bit DAC"
+    TICK = 0.002
+    MAX_PENDING_BYTES = 1 << 16
+
+    def __init__(self, frame_rate: float | None = None, signal=mfe_signal, fd: int | None = None):
+        if fd is None:
+            self.master, self.slave = pty.openpty()
+            tty.setraw(self.slave)
+            self.port = os.ttyname(self.slave)
+        else:  # e.g. one end of a socket pair
+            self.master, self.slave = fd, None
+            self.port = None
+        self.frame_rate_override = frame_rate
+        self.frame_rate = frame_rate or DRATE_SPS[208] / N_CHANNELS
+        self.signal = signal
+        self.debug = True
+        self.gain = 0
+        self.streaming = False
+        self.running = False
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self._seq = 0
+        self._stream_start = 0.
+        self._pending = b""
+        self._rx = b""
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self.run, name="DietrichSimulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        if self.slave is not None:
+            os.close(self.slave)
+
+    def run(self):
+        os.set_blocking(self.master, False)
+        self.running = True
+        while self.running:
+            readable, _, _ = select.select([self.master], [], [], self.TICK)
+            if readable:
+                self._receive()
+            if self.streaming:
+                self._send_due_frames()
+            else:
+                self._flush()
+
+    def _receive(self):
+        try:
+            self._rx += os.read(self.master, 1024)
+        except (BlockingIOError, OSError):
+            return
+        while b"\n" in self._rx:
+            line, self._rx = self._rx.split(b"\n", 1)
+            self.handle_command(line.decode("ascii", errors="ignore").strip().upper())
+
+    def _println(self, message: str):
+        self._write(message.encode("ascii") + b"\r\n")
+
+    def _write(self, data: bytes) -> bool:
+        """Queues data for the non-blocking pty, returns False if it had to be dropped."""
+        if len(self._pending) + len(data) > self.MAX_PENDING_BYTES:
+            self._flush()
+            if len(self._pending) + len(data) > self.MAX_PENDING_BYTES:
+                return False
+        self._pending += data
+        self._flush()
+        return True
+
+    def _flush(self):
+        if not self._pending:
+            return
+        try:
+            n_written = os.write(self.master, self._pending)
+        except BlockingIOError:
+            n_written = 0
+        self._pending = self._pending[n_written:]
+
+    def handle_command(self, line: str):
+        cmd, _, args = line.partition(" ")
+        if cmd == "IDN":
+            self._println(self.IDN)
+        elif cmd == "RST":
+            if self.debug:
+                self._println("Reset ADC")
+        elif cmd == "SET":
+            setting, _, value = args.partition(" ")
+            if setting == "DRATE":
+                if not self.frame_rate_override:
+                    self.frame_rate = DRATE_SPS[int(value)] / N_CHANNELS
+                if self.debug:
+                    self._println(f"Set drate to {value}")
+            elif setting == "GAIN":
+                self.gain = int(value)
+            elif setting == "DEBUG":
+                self.debug = bool(int(value))
+        elif cmd == "START":
+            self._seq = 0
+            self._pending = b""
+            self._stream_start = monotonic()
+            self.streaming = True
+        elif cmd == "STOP":
+            # the host resets its input buffer after STOP, drop what it would discard anyway
+            self.streaming = False
+            self._pending = b""
+        elif cmd == "NUM":
+            self._println(f"{self._seq}")
+        elif cmd:
+            logger.debug(f"Unknown command {cmd}")
+
+    def _send_due_frames(self):
+        due = int((monotonic() - self._stream_start) * self.frame_rate)
+        n_frames = due - self._seq
+        if n_frames <= 0:
+            return
+        t = (self._seq + np.arange(n_frames)) / self.frame_rate
+        data = encode_frames(self.signal(t), self._seq)
+        if self._write(data):
+            self.sent_frames += n_frames
+        else:
+            self.dropped_frames += n_frames
+        self._seq = due
+
+
+def main():
+    simulator = DietrichSimulator()
+    simulator.start()
+    print(f"Simulated Dietrich DAQ on {simulator.port}, stop with Ctrl+C")
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        simulator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import logging
+from time import monotonic, sleep
+import numpy as np
+import pandas as pd
+from controllers.Dietrich import DummyDevice, N_CHANNELS, VALUE_DTYPE
+from utils import mfe_file
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayDevice(DummyDevice):
+    """
+    Streams a recorded data.mfeb or data.csv (see Experiment.save) as if it came from the DAQ.
+
+    The file is read in chunks, so even multi-hour recordings are never loaded as a whole.
+    V_Hall and I_Photo are emitted on their stream channels; the OLED column is emitted on both
+    OLED channels (1 and 3), so the replay works for either power type. speed > 1 replays
+    faster than recorded, e.g. speed=60 plays an hour in a minute. The sample rate defaults to
+    the rate measured during the recording, if it is known.
+    """
+    DEFAULTS = DummyDevice.DEFAULTS | {
+        "sample_rate": 833.,
+        "chunk_size": 1 << 16,
+        "tick": 0.02,
+    }
+    COLUMNS = ["V_Hall", "OLED", "I_Photo"]
+
+    def __init__(self, port: str, file_path: str, speed: float = 1., sample_rate: float | None = None,
+                 loop: bool = False):
+        super().__init__(port)
+        self.file_path = file_path
+        self.speed = speed
+        self.sample_rate = sample_rate
+        self.loop = loop
+
+    def initialize(self):
+        if not os.path.isfile(self.file_path):
+            raise FileNotFoundError(f"Replay file {self.file_path} not found")
+        if not self.sample_rate and self.file_path.endswith(mfe_file.RECORDING_SUFFIX):
+            self.sample_rate = mfe_file.read_metadata(self.file_path).get("sample_rate")
+        self.sample_rate = self.sample_rate or self.DEFAULTS["sample_rate"]
+        logger.info(f"Replaying {self.file_path} at {self.sample_rate} Hz x {self.speed}")
+
+    def idn(self):
+        return f"Here is Replay with 24 Bit ADC and 16 Bit DAC ({os.path.basename(self.file_path)})"
+
+    def _read_chunks(self):
+        if self.file_path.endswith(mfe_file.RECORDING_SUFFIX):
+            yield from mfe_file.iter_chunks(self.file_path)
+            return
+        reader = pd.read_csv(self.file_path, usecols=self.COLUMNS, dtype=np.float32, comment="#",
+                             chunksize=self.DEFAULTS["chunk_size"])
+        with reader:
+            for chunk in reader:
+                yield {name: chunk[name].to_numpy() for name in self.COLUMNS}
+
+    def iter_chunks(self):
+        """Yields the recording as (n, N_CHANNELS) float32 chunks."""
+        while True:
+            for chunk in self._read_chunks():
+                values = np.empty((len(chunk["V_Hall"]), N_CHANNELS), dtype=VALUE_DTYPE)
+                values[:, 0] = chunk["V_Hall"]
+                values[:, 1] = chunk["OLED"]
+                values[:, 2] = chunk["I_Photo"]
+                values[:, 3] = values[:, 1]
+                yield values
+            if not self.loop:
+                return
+
+    def stream(self):
+        chunks = self.iter_chunks()
+        chunk = np.empty((0, N_CHANNELS), dtype=VALUE_DTYPE)
+        rate = self.sample_rate * self.speed
+        t0 = monotonic()
+        emitted = 0
+        while self.streaming:
+            n_due = int((monotonic() - t0) * rate) - emitted
+            while n_due > 0:
+                if not len(chunk):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        logger.info("Replay finished")
+                        self.streaming = False
+                        return
+                batch, chunk = chunk[:n_due], chunk[n_due:]
+                self.notify_listeners(batch)
+                emitted += len(batch)
+                n_due -= len(batch)
+            sleep(self.DEFAULTS["tick"])
@@ -0,0 +1,145 @@
+import threading
+import logging
+from collections import deque
+from time import perf_counter
+from typing import Callable
+import numpy as np
+from controllers.stream_timing import StreamBatch
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[np.ndarray], None]
+
+
+class ListenerDispatcher:
+    """
+    Fans out stream batches to the listeners on a dedicated dispatch thread.
+
+    The stream thread only copies the batch into a bounded queue. When the queue is full the
+    policy decides what happens:
+        block: the stream thread waits until the dispatch thread has taken a batch. While the
+               dispatcher is stopped nothing takes a batch, the new batch is dropped instead.
+        drop_oldest: the oldest queued batch is discarded
+        coalesce: the batch is appended to the newest queued batch, nothing is lost
+    """
+    POLICIES = ("block", "drop_oldest", "coalesce")
+
+    def __init__(self, maxsize: int = 64, policy: str = "block"):
+        self.listeners: list[Listener] = []
+        self._queue: deque[np.ndarray] = deque()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+        self.configure(maxsize, policy)
+        self.reset_stats()
+
+    def configure(self, maxsize: int | None = None, policy: str | None = None):
+        if policy is not None:
+            if policy not in self.POLICIES:
+                raise ValueError(f"Unknown dispatch policy {policy}. Use one of {self.POLICIES}")
+            self.policy = policy
+        if maxsize is not None:
+            self.maxsize = max(1, int(maxsize))
+
+    def reset_stats(self):
+        self._max_depth = 0
+        self._dispatched = 0
+        self._dropped_batches = 0
+        self._dropped_frames = 0
+        self._coalesced = 0
+        self._listener_stats: dict[Listener, list[float]] = {}  # listener: [calls, total time, max time]
+
+    def add_listener(self, listener: Listener) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Listener) -> None:
+        try:
+            self.listeners.remove(listener)
+        except ValueError:
+            pass
+
+    def put(self, values: np.ndarray) -> None:
+        """Queues a copy of values, the caller may reuse its buffer afterwards."""
+        batch = np.array(values, subok=True)
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                if self.policy == "block":
+                    while self._running and len(self._queue) >= self.maxsize:
+                        self._cond.wait()
+                    if len(self._queue) >= self.maxsize:
+                        self._dropped_batches += 1
+                        self._dropped_frames += len(batch)
+                        return
+                elif self.policy == "drop_oldest":
+                    dropped = self._queue.popleft()
+                    self._dropped_batches += 1
+                    self._dropped_frames += len(dropped)
+                elif self.policy == "coalesce":
+                    self._queue[-1] = StreamBatch.concatenate(self._queue[-1], batch)
+                    self._coalesced += 1
+                    self._cond.notify_all()
+                    return
+            self._queue.append(batch)
+            self._max_depth = max(self._max_depth, len(self._queue))
+            self._cond.notify_all()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="ListenerDispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stops the dispatch thread after all queued batches are delivered."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                batch = self._queue.popleft()
+                self._cond.notify_all()
+            self._notify(batch)
+
+    def _notify(self, batch: np.ndarray) -> None:
+        for listener in list(self.listeners):
+            t0 = perf_counter()
+            try:
+                listener(batch)
+            except Exception:
+                logger.error(f"Stream listener {listener} failed", exc_info=True)
+            elapsed = perf_counter() - t0
+            stats = self._listener_stats.setdefault(listener, [0, 0., 0.])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+        self._dispatched += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "queue_depth": len(self._queue),
+            "queue_max_depth": self._max_depth,
+            "queue_size": self.maxsize,
+            "dispatched_batches": self._dispatched,
+            "dropped_batches": self._dropped_batches,
+            "dropped_frames": self._dropped_frames,
+            "coalesced_batches": self._coalesced,
+            "listeners": {
+                getattr(listener, "__qualname__", repr(listener)): {
+                    "calls": calls,
+                    "mean_latency": total / calls if calls else 0.,
+                    "max_latency": max_time,
+                }
+                for listener, (calls, total, max_time) in list(self._listener_stats.items())
+            },
+        }
@@ -0,0 +1,93 @@
+from collections import deque
+from time import monotonic
+import numpy as np
+
+
+class StreamBatch(np.ndarray):
+    """
+    (n, N_CHANNELS) values of one stream batch, stamped with the host monotonic time t at which
+    the batch was received and the running frame index of its first frame since the stream
+    started. Lost frames are part of the batch (NaN rows), so the index advances with the
+    device clock. Listeners which do not care about the stamps use it like any other ndarray.
+    """
+    t: float
+    index: int
+
+    @classmethod
+    def stamp(cls, values: np.ndarray, index: int, t: float | None = None) -> 'StreamBatch':
+        batch = np.asarray(values).view(cls)
+        batch.index = index
+        batch.t = monotonic() if t is None else t
+        return batch
+
+    def __array_finalize__(self, obj):
+        self.t = getattr(obj, "t", np.nan)
+        self.index = getattr(obj, "index", 0)
+
+    @classmethod
+    def concatenate(cls, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """Joins two consecutive batches, keeping the index of the first and the time of the second."""
+        values = np.concatenate((np.asarray(first), np.asarray(second)))
+        if not isinstance(first, cls) or not isinstance(second, cls):
+            return values
+        return cls.stamp(values, first.index, second.t)
+
+
+class RateEstimator:
+    """
+    Estimates the frame rate from the (t, index) stamps of the received batches.
+
+    The receive time of a batch jitters by the read latency, but this error does not accumulate,
+    so the rate between two stamps far apart is accurate. rate uses the stamps of the last
+    window seconds for live display, mean_rate all stamps. An index which jumps back (a restarted
+    stream) starts a new segment, the time between streams is not counted.
+    """
+    def __init__(self, window: float = 10.):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.segments: list[dict] = []
+        self._stamps: deque[tuple[float, int]] = deque()
+
+    def update(self, t: float, index: int, n_frames: int) -> None:
+        end = index + n_frames
+        if not self._stamps or index < self._stamps[-1][1]:
+            self._stamps.clear()
+            self.segments.append({"start_index": index, "n_frames": 0, "first": (t, end), "last": (t, end)})
+        segment = self.segments[-1]
+        segment["n_frames"] += n_frames
+        segment["last"] = (t, end)
+        self._stamps.append((t, end))
+        while len(self._stamps) > 2 and t - self._stamps[0][0] > self.window:
+            self._stamps.popleft()
+
+    @staticmethod
+    def _rate(first: tuple[float, int], last: tuple[float, int]) -> float:
+        duration = last[0] - first[0]
+        return (last[1] - first[1]) / duration if duration > 0 else np.nan
+
+    @property
+    def rate(self) -> float:
+        if len(self._stamps) < 2:
+            return np.nan
+        return self._rate(self._stamps[0], self._stamps[-1])
+
+    @property
+    def mean_rate(self) -> float:
+        frames = sum(s["last"][1] - s["first"][1] for s in self.segments)
+        duration = sum(s["last"][0] - s["first"][0] for s in self.segments)
+        return frames / duration if duration > 0 else np.nan
+
+    def get_segments(self) -> list[dict]:
+        """
+        One entry per stream with its number of frames, rate and the host time of its first frame,
+        enough to reconstruct a continuous timestamp for every sample.
+        """
+        segments = []
+        for segment in self.segments:
+            rate = self._rate(segment["first"], segment["last"])
+            t_first, end_first = segment["first"]
+            t_start = t_first - (end_first - segment["start_index"]) / rate if rate > 0 else t_first
+            segments.append({"n_frames": segment["n_frames"], "rate": rate, "t_start": t_start})
+        return segments
@@ -20,7 +20,11 @@ from PyQt5.QtGui import QColor, QPixmap, QIcon, QPainter
 from typing import Iterable, Callable
 from model.daq import get_available_ports, get_cp210x_uart_port, DRATE_CODES, GAIN_CODES
 import pyqtgraph as pg
+import numpy as np
 import os
+import threading
+from collections import deque
+from time import perf_counter
 from model.experiment import Experiment
 
 import logging
@@ -52,6 +56,117 @@ class ExperimentWorker(QObject):
     def _on_progress(self, progress: float):
         self.progress_signal.emit(progress)
 
+class SaveWorker(QObject):
+    """
+    Saves a measurement on a worker thread. The data store and its snapshot are taken when the
+    worker is created, so a new stream can start right away without changing what is saved.
+    The event loop of the worker thread is blocked while run() writes, so cancel() must be called
+    directly from the GUI thread (Qt.DirectConnection), the writing polls the flag between chunks.
+    """
+    progress_signal = pyqtSignal(float)
+    finished_signal = pyqtSignal(str)  # measurement directory, empty if cancelled
+    failed_signal = pyqtSignal(str)
+
+    def __init__(self, experiment: Experiment, path: str, probe_name: str):
+        super().__init__()
+        self.experiment = experiment
+        self.path = path
+        self.probe_name = probe_name
+        self.data_store = experiment.data_store
+        self.snapshot = self.data_store.snapshot()
+        self._cancelled = threading.Event()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            experiment_dir = self.experiment.save(
+                self.path, self.probe_name, data_store=self.data_store, snapshot=self.snapshot,
+                progress=self.progress_signal.emit, cancelled=self.is_cancelled,
+            )
+        except Exception as e:
+            logger.error("Saving failed", exc_info=True)
+            self.failed_signal.emit(str(e))
+            return
+        self.finished_signal.emit(experiment_dir or "")
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+
+class AdaptiveRefresher(QObject):
+    """
+    Redraws a plot widget when new data has arrived instead of on a fixed timer.
+
+    refresh is only called if version() has changed (new samples, another zoom range, ...) and
+    the widget is visible and not minimized. Otherwise the refresher idles at IDLE_INTERVAL, which
+    only compares the version. While data is flowing the interval adapts between min_interval and
+    MAX_INTERVAL: a frame may use at most LOAD of the GUI thread, and timers firing late (a busy
+    event loop) make it back off further.
+    """
+    MAX_INTERVAL = 1000  # ms
+    IDLE_INTERVAL = 500  # ms
+    LOAD = 0.25
+    stats_signal = pyqtSignal(float, float)  # achieved fps, ms per frame
+
+    def __init__(self, widget: QWidget, refresh: Callable[[], None], version: Callable[[], object],
+                 min_interval: int = 33):
+        super().__init__(widget)
+        self.widget = widget
+        self.refresh = refresh
+        self.version = version
+        self.min_interval = min_interval
+        self.interval = float(min_interval)
+        self.frame_cost = 0.
+        self._last_version = None
+        self._frames: deque[float] = deque()
+        self._due = 0.
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._on_timeout)
+
+    def start(self):
+        self._schedule(self.min_interval)
+
+    def stop(self):
+        self.timer.stop()
+
+    def invalidate(self):
+        """Redraw on the next tick even if the version is unchanged."""
+        self._last_version = None
+
+    def _schedule(self, interval: float):
+        self._due = perf_counter() + interval / 1000
+        self.timer.start(int(interval))
+
+    def _on_timeout(self):
+        now = perf_counter()
+        lateness = now - self._due
+        self._update_fps(now)
+        visible = self.widget.isVisible() and not self.widget.window().isMinimized()
+        version = self.version() if visible else None
+        if not visible or version == self._last_version:
+            self._schedule(self.IDLE_INTERVAL)
+            return
+        self.refresh()
+        cost = perf_counter() - now
+        self._last_version = version
+        self._frames.append(now)
+        self.frame_cost = cost if not self.frame_cost else 0.8 * self.frame_cost + 0.2 * cost
+        interval = max(self.min_interval, 1000 * self.frame_cost / self.LOAD)
+        if lateness * 1000 > 0.5 * self.interval:
+            interval = max(interval, 1.5 * self.interval)
+        self.interval = min(interval, self.MAX_INTERVAL)
+        self._schedule(self.interval)
+
+    def _update_fps(self, now: float):
+        while self._frames and now - self._frames[0] > 2.:
+            self._frames.popleft()
+        self.stats_signal.emit(len(self._frames) / 2., 1000 * self.frame_cost)
+
+
 class StatusWidget(QFrame):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -109,7 +224,7 @@ class DebugActions(QWidget):
         self.update_status("Debugging")
         if self.start_callback:
             self.start_callback()
-        self.experiment.debug_stream(self.experiment.data_store.listen)
+        self.experiment.debug_stream()
         self.start_button.setVisible(False)
         self.stop_button.setVisible(True)
         self.status_refresh_timer.start(1000)
@@ -234,14 +349,13 @@ class ResultPlotWidget(pg.GraphicsLayoutWidget):
         self.configure_plot_widget(self.oled_plot_widget, "LED/B")
         self.configure_plot_widget(self.I_photo_plot_widget, "Photo/B")
         self.I_photo_plot_widget.setXLink(self.oled_plot_widget)
-        self.oled_plot = self.oled_plot_widget.plot()
-        self.I_photo_plot = self.I_photo_plot_widget.plot()
-        self.configure_plot(self.oled_plot, QColor(36, 252, 3))
-        self.configure_plot(self.I_photo_plot, QColor(3, 215, 252))
-        self.update_timer = QTimer()
-        self.update_timer.timeout.connect(self._update_plots)
-        self.update_timer.start(1000)
+        self.oled_curves = self.add_binned_curves(self.oled_plot_widget, QColor(36, 252, 3))
+        self.I_photo_curves = self.add_binned_curves(self.I_photo_plot_widget, QColor(3, 215, 252))
+        self.refresh_label = add_refresh_label(self, row=2)
         self.experiment = experiment
+        self.refresher = AdaptiveRefresher(self, self._update_plots, self._data_version, min_interval=100)
+        self.refresher.stats_signal.connect(self._on_refresh_stats)
+        self.refresher.start()
 
     def configure_plot_widget(self, plot_widget, name):
         fg_color = os.environ.get("QTMATERIAL_PRIMARYCOLOR")
@@ -256,18 +370,38 @@ class ResultPlotWidget(pg.GraphicsLayoutWidget):
         plot_widget.setLabel("bottom", "B", units="T")
         plot_widget.enableAutoRange()
 
-    def configure_plot(self, plot, color):
-        plot.setPen(color)
-        plot.setDownsampling(ds=None, auto=True, method="mode")
+    def add_binned_curves(self, plot_widget, color: QColor) -> list[tuple]:
+        """mean curve and mean ± std band for rising and falling B (darker)"""
+        curves = []
+        for direction_color in (color, color.darker(160)):
+            band_color = QColor(direction_color)
+            band_color.setAlpha(60)
+            mean = plot_widget.plot(pen=direction_color)
+            upper = plot_widget.plot(pen=None)
+            lower = plot_widget.plot(pen=None)
+            plot_widget.addItem(pg.FillBetweenItem(upper, lower, brush=band_color))
+            curves.append((mean, upper, lower))
+        return curves
+
+    def _data_version(self):
+        binned = self.experiment.data_store.binned
+        return id(binned), binned.version
+
+    def _on_refresh_stats(self, fps: float, frame_ms: float):
+        self.refresh_label.setText(f"{fps:.1f} fps, {frame_ms:.1f} ms")
 
     def _update_plots(self):
-        idx = self.experiment.data_store.plot_idx
-        self.oled_plot.setData(
-            y=self.experiment.data_store.oled_list[idx:], x=self.experiment.data_store.magnet_B_list[idx:]
-        )
-        self.I_photo_plot.setData(
-            y=self.experiment.data_store.I_photo_list[idx:], x=self.experiment.data_store.magnet_B_list[idx:]
-        )
+        binned = self.experiment.data_store.binned
+        for curves, column in ((self.oled_curves, 'OLED'), (self.I_photo_curves, 'I_Photo')):
+            stats = binned.stats(column)
+            for direction, (mean, upper, lower) in enumerate(curves):
+                filled = stats['count'][direction] > 0
+                B = stats['B'][filled]
+                y = stats['mean'][direction][filled]
+                std = stats['std'][direction][filled]
+                mean.setData(x=B, y=y)
+                upper.setData(x=B, y=y + std)
+                lower.setData(x=B, y=y - std)
 
 
 class ADCPlotWidget(pg.GraphicsLayoutWidget):
@@ -288,10 +422,11 @@ class ADCPlotWidget(pg.GraphicsLayoutWidget):
         self.configure_plot(self.hall_plot, QColor(207, 3, 252))
         self.configure_plot(self.oled_plot, QColor(36, 252, 3))
         self.configure_plot(self.I_photo_plot, QColor(3, 215, 252))
-        self.update_timer = QTimer()
-        self.update_timer.timeout.connect(self._update_plots)
-        self.update_timer.start(50)
+        self.refresh_label = add_refresh_label(self, row=3)
         self.experiment = experiment
+        self.refresher = AdaptiveRefresher(self, self._update_plots, self._data_version)
+        self.refresher.stats_signal.connect(self._on_refresh_stats)
+        self.refresher.start()
 
     def configure_plot_widget(self, plot_widget, name):
         fg_color = os.environ.get("QTMATERIAL_PRIMARYCOLOR")
@@ -309,11 +444,42 @@ class ADCPlotWidget(pg.GraphicsLayoutWidget):
     def configure_plot(self, plot, color):
         plot.setPen(color)
 
+    def _visible_range(self, plot_idx: int) -> tuple[int, int | None]:
+        """Sample range to fetch: everything while auto ranging, otherwise the visible x range."""
+        view_box = self.hall_plot_widget.getViewBox()
+        if view_box.state['autoRange'][0]:
+            return plot_idx, None
+        x_min, x_max = view_box.viewRange()[0]
+        return plot_idx + max(0, int(np.floor(x_min))), plot_idx + max(0, int(np.ceil(x_max)) + 1)
+
+    def _max_points(self) -> int:
+        # two points (min and max) per pixel column
+        return 2 * max(1, int(self.hall_plot_widget.getViewBox().width()))
+
+    def _data_version(self):
+        data_store = self.experiment.data_store
+        start, stop = self._visible_range(data_store.plot_idx)
+        # samples after the visible range do not change the plot
+        total = data_store.store.total if stop is None else min(stop, data_store.store.total)
+        return id(data_store), start, stop, total, self._max_points()
+
+    def _on_refresh_stats(self, fps: float, frame_ms: float):
+        self.refresh_label.setText(f"{fps:.1f} fps, {frame_ms:.1f} ms")
+
     def _update_plots(self):
-        idx = self.experiment.data_store.plot_idx
-        self.hall_plot.setData(y=self.experiment.data_store.V_hall_list[idx:])
-        self.oled_plot.setData(y=self.experiment.data_store.oled_list[idx:])
-        self.I_photo_plot.setData(y=self.experiment.data_store.I_photo_list[idx:])
+        data_store = self.experiment.data_store
+        plot_idx = data_store.plot_idx
+        start, stop = self._visible_range(plot_idx)
+        max_points = self._max_points()
+        for plot_widget, plot, column in (
+            (self.hall_plot_widget, self.hall_plot, 'V_Hall'),
+            (self.oled_plot_widget, self.oled_plot, 'OLED'),
+            (self.I_photo_plot_widget, self.I_photo_plot, 'I_Photo'),
+        ):
+            if not plot_widget.isVisible():
+                continue
+            x, y = data_store.pyramid.envelope(column, start, stop, max_points)
+            plot.setData(x=x - plot_idx, y=y)
 
     def set_auto_range(self):
         self.hall_plot_widget.enableAutoRange()
@@ -321,6 +487,12 @@ class ADCPlotWidget(pg.GraphicsLayoutWidget):
         self.I_photo_plot_widget.enableAutoRange()
 
 
+def add_refresh_label(layout_widget: pg.GraphicsLayoutWidget, row: int) -> pg.LabelItem:
+    label = layout_widget.addLabel(row=row, col=0, justify="right", size="7pt",
+                                   color=os.environ.get("QTMATERIAL_SECONDARYTEXTCOLOR"))
+    return label
+
+
 class SettingsTitle(QLabel):
     def __init__(self, title: str, parent=None):
         super().__init__(title)
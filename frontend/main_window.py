@@ -2,7 +2,7 @@ import re
 import numpy as np
 import serial
 import yaml
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtCore import Qt, QSize, QThread
 from PyQt5.QtWidgets import (
     QMainWindow,
     QHBoxLayout,
@@ -30,6 +30,7 @@ from frontend.Widgets import (
     ResultPlotWidget,
     DebugActions,
     ExperiementActions,
+    SaveWorker,
 )
 
 logger = logging.getLogger(__name__)
@@ -53,6 +54,7 @@ class MainWindow(QMainWindow):
     def build_gui(self):
         self.setWindowTitle("MFE Measurement")
         self.isExperimentLoad = False
+        self.save_thread: QThread | None = None
         self.widget = QWidget()
         self._layout = QVBoxLayout(self.widget)
         self.titleBar = MyBar(self)
@@ -137,6 +139,8 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         self.debug_buttons.close()
         self.experiment_actions.close()
+        if self.save_thread and self.save_thread.isRunning():
+            self.save_thread.wait()
         self._updateConfigFile()
 
     def _updateConfigFile(self):
@@ -169,7 +173,37 @@ class MainWindow(QMainWindow):
         dirPath = QtWidgets.QFileDialog.getExistingDirectory(self, "Save to", last_path)
         if not os.path.isdir(dirPath):
             return
-        self.experiment.save(dirPath, probe_name=probe_name)
+        if self.save_thread and self.save_thread.isRunning():
+            self.status_widget.set_status("Still saving the previous measurement")
+            return
+        self.save_thread = QThread()
+        self.save_worker = SaveWorker(self.experiment, dirPath, probe_name)
+        self.save_worker.moveToThread(self.save_thread)
+        self.save_progress = QtWidgets.QProgressDialog(f"Saving {probe_name}...", "Cancel", 0, 100, self)
+        self.save_progress.setMinimumDuration(500)
+        # the worker thread is busy in run(), a queued call would only arrive after the save
+        self.save_progress.canceled.connect(self.save_worker.cancel, Qt.DirectConnection)
+        self.save_thread.started.connect(self.save_worker.run)
+        self.save_worker.progress_signal.connect(self._on_save_progress)
+        self.save_worker.finished_signal.connect(self._on_save_finished)
+        self.save_worker.failed_signal.connect(self._on_save_failed)
+        self.save_worker.finished_signal.connect(self.save_thread.quit)
+        self.save_worker.failed_signal.connect(self.save_thread.quit)
+        self.save_thread.start()
+
+    def _on_save_progress(self, progress: float):
+        self.save_progress.setValue(int(progress * 100))
+
+    def _on_save_finished(self, experiment_dir: str):
+        self.save_progress.reset()
+        if experiment_dir:
+            self.status_widget.set_status(f"Saved to {experiment_dir}")
+        else:
+            self.status_widget.set_status("Saving cancelled")
+
+    def _on_save_failed(self, message: str):
+        self.save_progress.reset()
+        self.status_widget.set_status(f"Saving failed: {message}")
 
 
     def _on_run(self):
@@ -0,0 +1,109 @@
+import threading
+import numpy as np
+from model.ramps import RampTracker
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class BinnedAccumulator:
+    """
+    Accumulates signals over a fixed B grid, separately for rising and falling B.
+
+    Per column, ramp direction and bin the count, sum, sum of squares, min and max are kept, so
+    mean and standard deviation of every bin are available at any time with constant memory.
+    The ramp direction of the samples comes from the RampTracker of the data store. Samples
+    outside the grid or with NaN (lost frames) are ignored.
+    """
+    UP, DOWN = RampTracker.UP, RampTracker.DOWN
+
+    def __init__(self, columns: list[str], b_min: float = -200., b_max: float = 200., n_bins: int = 400):
+        self.columns = list(columns)
+        self.b_min = b_min
+        self.n_bins = n_bins
+        self.bin_width = (b_max - b_min) / n_bins
+        self.centers = b_min + (np.arange(n_bins) + 0.5) * self.bin_width
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        shape = (len(self.columns), 2, self.n_bins)
+        with self._lock:
+            self.count = np.zeros(shape, dtype=np.int64)
+            self.sum = np.zeros(shape)
+            self.sum2 = np.zeros(shape)
+            self.min = np.full(shape, np.inf)
+            self.max = np.full(shape, -np.inf)
+            self.version = 0
+
+    def append(self, B: np.ndarray, columns: dict[str, np.ndarray | float | None],
+               directions: np.ndarray) -> None:
+        """directions: ramp direction (UP or DOWN) of the samples"""
+        B = np.asarray(B, dtype=np.float64)
+        if not len(B):
+            return
+        size = 2 * self.n_bins
+        # bin of the samples, clipped to one extra bin below and above the grid, the extra bins
+        # and NaN are dropped after the runs are found
+        bins = B - self.b_min
+        bins /= self.bin_width
+        np.floor(bins, out=bins)
+        np.clip(bins, -1, self.n_bins, out=bins)
+        # B moves slowly, consecutive samples mostly fall into the same bin: the samples are
+        # reduced per run of equal bins and direction first and only the runs are scattered into
+        # the grid
+        changed = bins[1:] != bins[:-1]
+        changed |= directions[1:] != directions[:-1]
+        starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+        run_bins = bins[starts]
+        keep = (run_bins >= 0) & (run_bins < self.n_bins)  # False for NaN
+        run_directions = directions[starts].astype(np.int64)
+        run_idx = (run_bins + run_directions * self.n_bins)[keep].astype(np.int64)
+        lengths = np.diff(starts, append=len(B))[keep]
+        # a missing column is ignored like NaN
+        given = [i for i, column in enumerate(self.columns) if columns.get(column) is not None]
+        if not given:
+            return
+        stats = []
+        for i in given:
+            # converted once, the reductions are fastest on a contiguous float64 column
+            values = np.ascontiguousarray(np.broadcast_to(np.asarray(columns[self.columns[i]], dtype=np.float64), B.shape))
+            sums = np.add.reduceat(values, starts)[keep]
+            counts = lengths
+            lo = hi = values
+            if not np.isfinite(sums).all():
+                # lost frames (NaN) in a run, reduced again without them
+                finite = np.isfinite(values)
+                counts = np.add.reduceat(finite, starts, dtype=np.int64)[keep]
+                lo = np.where(finite, values, np.inf)
+                hi = np.where(finite, values, -np.inf)
+                values = np.where(finite, values, 0.)
+                sums = np.add.reduceat(values, starts)[keep]
+            sums2 = np.add.reduceat(values * values, starts)[keep]
+            mins = np.minimum.reduceat(lo, starts)[keep]
+            maxs = np.maximum.reduceat(hi, starts)[keep]
+            stats.append((i, counts, sums, sums2, mins, maxs))
+        with self._lock:
+            for i, counts, sums, sums2, mins, maxs in stats:
+                self.count[i] += np.bincount(run_idx, weights=counts, minlength=size).astype(np.int64).reshape(2, -1)
+                self.sum[i] += np.bincount(run_idx, weights=sums, minlength=size).reshape(2, -1)
+                self.sum2[i] += np.bincount(run_idx, weights=sums2, minlength=size).reshape(2, -1)
+                np.minimum.at(self.min[i].ravel(), run_idx, mins)
+                np.maximum.at(self.max[i].ravel(), run_idx, maxs)
+            self.version += 1
+
+    def stats(self, column: str) -> dict[str, np.ndarray]:
+        """B (bin centers) and count, mean, std, min and max of the column as (2, n_bins) arrays, NaN for empty bins."""
+        i = self.columns.index(column)
+        with self._lock:
+            count = self.count[i].copy()
+            total = self.sum[i].copy()
+            total2 = self.sum2[i].copy()
+            lo = self.min[i].copy()
+            hi = self.max[i].copy()
+        empty = count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            std = np.sqrt(np.maximum(total2 / count - mean * mean, 0.))
+        lo[empty] = hi[empty] = np.nan
+        return {'B': self.centers, 'count': count, 'mean': mean, 'std': std, 'min': lo, 'max': hi}
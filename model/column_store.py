@@ -0,0 +1,92 @@
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ColumnStore:
+    """
+    Growable float32 column store.
+
+    All columns live in one (n_columns, capacity) array, so every column is contiguous and
+    can be handed out as a zero-copy view. Batches are ingested with one slice assignment per
+    column. The capacity grows in multiples of chunk_size by at least GROWTH_FACTOR: the unused
+    part stays below ~6 % of the samples, while the amortized cost of the reallocations is a
+    constant (~16 copies of each sample).
+    The number of valid samples is only advanced after all columns of a batch are written, so
+    views taken from another thread always have the same length for every column.
+    """
+    GROWTH_FACTOR = 1.0625
+
+    def __init__(self, columns: list[str], chunk_size: int = 1 << 14, dtype=np.float32):
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self._column_idx = {name: i for i, name in enumerate(self.columns)}
+        self._data = np.empty((len(self.columns), chunk_size), dtype=self.dtype)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        size = self._size  # read before the array: a reallocated array always holds all samples
+        return self._data[self._column_idx[column], :size]
+
+    @property
+    def total(self) -> int:
+        """Number of samples, i.e. the index of the next sample (see RingBuffer.total)."""
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return self._data.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def _reserve(self, n_samples: int):
+        required = self._size + n_samples
+        if required <= self.capacity:
+            return
+        capacity = max(required, int(self.capacity * self.GROWTH_FACTOR))
+        capacity = -(-capacity // self.chunk_size) * self.chunk_size
+        data = np.empty((len(self.columns), capacity), dtype=self.dtype)
+        data[:, :self._size] = self._data[:, :self._size]
+        self._data = data
+
+    def append(self, columns: dict[str, np.ndarray | float], n_samples: int) -> None:
+        """
+        Appends n_samples to the store. Values are arrays of length n_samples or scalars, which
+        are broadcast. Columns which are not given are filled with NaN.
+        """
+        if n_samples <= 0:
+            return
+        self._reserve(n_samples)
+        start, stop = self._size, self._size + n_samples
+        for name, idx in self._column_idx.items():
+            value = columns.get(name)
+            self._data[idx, start:stop] = np.nan if value is None else value
+        self._size = stop
+
+    def view(self, start: int = 0, stop: int | None = None) -> dict[str, np.ndarray]:
+        """Zero-copy views of all columns for the samples [start, stop)."""
+        if stop is None:
+            stop = self._size
+        data = self._data  # after reading the size, see __getitem__
+        return {name: data[idx, start:stop] for name, idx in self._column_idx.items()}
+
+    def clear(self):
+        self._data = np.empty((len(self.columns), self.chunk_size), dtype=self.dtype)
+        self._size = 0
+
+    def to_csv(self, file_path: str, formats: dict[str, str] | None = None):
+        save_csv(file_path, self.view(), formats)
+
+
+def save_csv(file_path: str, columns: dict[str, np.ndarray], formats: dict[str, str] | None = None):
+    formats = formats or {}
+    fmt = [formats.get(name, "%.7g") for name in columns]
+    data = np.column_stack(list(columns.values())) if columns else np.empty((0, 0))
+    np.savetxt(file_path, data, fmt=fmt, delimiter=",", header=",".join(columns), comments="")
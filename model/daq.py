@@ -1,17 +1,21 @@
-from config.config import DEBUG
-if DEBUG:
+from config.config import DEBUG, REPLAY_FILE, REPLAY_SPEED
+if REPLAY_FILE:
+    from functools import partial
+    from controllers.Replay import ReplayDevice
+    Device = partial(ReplayDevice, file_path=REPLAY_FILE, speed=REPLAY_SPEED)
+elif DEBUG:
     from controllers.Dietrich import DummyDevice as Device
 else: 
     from controllers.Dietrich import Device
-from typing import Callable
+from controllers.Dietrich import DeviceListener
+from controllers.AsyncDietrich import AsyncDevice
+import asyncio
 import serial
 import serial.tools.list_ports
 import logging
 logger = logging.getLogger(__name__)
 
 
-DeviceListener = Callable[[list[tuple[float, float, float]]], None]
-
 GAIN_CODES = {
     '1x': '0',
     '2x': '1',
@@ -42,7 +46,7 @@ DRATE_CODES = {
 }
 
 def get_cp210x_uart_port() -> str:
-        if DEBUG:
+        if DEBUG or REPLAY_FILE:
             return 'COM1'
         ports = serial.tools.list_ports.comports()
         for p in sorted(ports):
@@ -82,6 +86,21 @@ class AnalogDaq:
     def remove_stream_listener(self, listener: DeviceListener):
         self.driver.remove_listener(listener)
 
+    def set_stream_params(self, latency: float | None = None, min_batch_frames: int | None = None):
+        self.driver.set_stream_params(latency, min_batch_frames)
+
+    def set_dispatch_policy(self, policy: str | None = None, queue_size: int | None = None):
+        """policy: 'block', 'drop_oldest' or 'coalesce' when the listener queue is full"""
+        self.driver.set_dispatch_policy(policy, queue_size)
+
+    def get_stream_stats(self) -> dict:
+        """queue depth, drops and per-listener latency of the current/last stream"""
+        return self.driver.get_stream_stats()
+
+    def get_sample_rate(self) -> float:
+        """rate per channel measured on the running stream, without restarting it"""
+        return self.driver.get_sample_rate()
+
     def start_stream(self):
         self.driver.start_stream()
 
@@ -89,4 +108,69 @@ class AnalogDaq:
         self.driver.stop_stream()
 
     def finalize(self):
-        self.driver.finalize()
\ No newline at end of file
+        self.driver.finalize()
+
+class AsyncAnalogDaq:
+    """
+    AnalogDaq for an asyncio event loop, see controllers/AsyncDietrich.py.
+
+    Consume the stream either with async for batch in daq.batches() or with stream listeners,
+    which are called on the event loop. Always talks to a real port (or a simulator pty/socket),
+    DEBUG and REPLAY_FILE only apply to AnalogDaq.
+    """
+    def __init__(self, port: str | None, sock=None):
+        self.port = port
+        self.driver = AsyncDevice(port, sock)
+        self.listeners: list[DeviceListener] = []
+        self._pump: asyncio.Task | None = None
+
+    async def initialize(self):
+        await self.driver.initialize()
+
+    async def getIDN(self):
+        return await self.driver.idn()
+
+    def resetDevice(self):
+        self.driver.reset()
+
+    def setParamters(self, gain: str, sampling_rate: str):
+        self.driver.set_gain(gain)
+        self.driver.set_rate(sampling_rate)
+
+    def add_stream_listener(self, listener: DeviceListener):
+        self.listeners.append(listener)
+
+    def remove_stream_listener(self, listener: DeviceListener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def batches(self):
+        return self.driver.batches()
+
+    async def _notify_listeners(self):
+        async for batch in self.driver.batches():
+            for listener in list(self.listeners):
+                try:
+                    listener(batch)
+                except Exception:
+                    logger.error(f"Stream listener {listener} failed", exc_info=True)
+
+    def get_sample_rate(self) -> float:
+        return self.driver.get_sample_rate()
+
+    def get_stream_stats(self) -> dict:
+        return self.driver.get_stream_stats()
+
+    async def start_stream(self):
+        await self.driver.start_stream()
+        if self.listeners:
+            self._pump = asyncio.create_task(self._notify_listeners())
+
+    async def stop_stream(self):
+        await self.driver.stop_stream()
+        if self._pump:
+            await self._pump
+            self._pump = None
+
+    async def finalize(self):
+        await self.driver.finalize()
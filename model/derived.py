@@ -0,0 +1,57 @@
+import threading
+import numpy as np
+from utils.mfe_file import calibrate
+from model.column_store import ColumnStore
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DerivedColumns:
+    """
+    Columns which are a polynomial calibration of a stored column, e.g. B of V_Hall.
+
+    They are not stored per sample: get() computes a column vectorized on the first access and
+    caches it in a growable ColumnStore, samples appended to the store since are computed on the
+    next access and appended, so an access costs only the new samples and returns a view.
+    Changing a calibration drops its cache. The calibrations are saved with the measurement, so the
+    processing derives the same columns (see mfe_file.derive_columns).
+    """
+    def __init__(self, calibrations: dict[str, tuple[str, list[float]]]):
+        """calibrations: name -> (source column, coefficients c0, c1, ... of c0 + c1 * x + ...)"""
+        self._lock = threading.Lock()
+        self.calibrations: dict[str, dict] = {}
+        self._cache: dict[str, ColumnStore] = {}
+        for name, (source, coefficients) in calibrations.items():
+            self.set_calibration(name, source, coefficients)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.calibrations
+
+    def set_calibration(self, name: str, source: str, coefficients: list[float]) -> None:
+        with self._lock:
+            self.calibrations[name] = {'source': source, 'coefficients': [float(c) for c in coefficients]}
+            self._cache.pop(name, None)
+
+    def source(self, name: str) -> str:
+        return self.calibrations[name]['source']
+
+    def compute(self, name: str, values: np.ndarray) -> np.ndarray:
+        """The derived column for values of its source column, without caching."""
+        return calibrate(values, self.calibrations[name]['coefficients'])
+
+    def get(self, name: str, store) -> np.ndarray:
+        """The derived column for all samples of store, which must only grow (ColumnStore)."""
+        with self._lock:
+            values = store[self.source(name)]
+            cached = self._cache.get(name)
+            if cached is None or len(cached) > len(values):
+                cached = self._cache[name] = ColumnStore([name], dtype=values.dtype)
+            if len(cached) < len(values):
+                new = values[len(cached):]
+                cached.append({name: self.compute(name, new)}, len(new))
+            return cached[name]
+
+    def to_dict(self) -> dict[str, dict]:
+        with self._lock:
+            return {name: dict(calibration) for name, calibration in self.calibrations.items()}
@@ -1,16 +1,29 @@
-from config.config import CONFIG_FILE, DEBUG
+from config.config import CONFIG_FILE, DEBUG, RECORDING_DIR
 import typing
 import numpy as np
 import yaml
 import os
-import csv
+import threading
+from collections import deque
 from model.daq import AnalogDaq
 from model.oled import Oled
-from time import sleep
+from model.column_store import ColumnStore, save_csv
+from model.ring_buffer import RingBuffer
+from model.pyramid import MinMaxPyramid
+from model.binned import BinnedAccumulator
+from model.recorder import StreamRecorder, recover_recordings
+from model.segments import SegmentTable
+from model.ramps import RampTracker
+from model.derived import DerivedColumns
+from controllers.stream_timing import RateEstimator
+from utils.mfe_file import write_measurement, derive_columns
+from time import sleep, monotonic
+from datetime import datetime
 from utils.save_utils import create_dir, save_config_file, create_date_dir
 from enum import Enum
 from abc import ABC
 from model.daq import GAIN_CODES, DRATE_CODES
+from controllers.Dietrich import N_CHANNELS
 
 if DEBUG:
     from controllers.CryoRelais import DummyCryoRelais as CryoRelais
@@ -26,87 +39,281 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# seconds of the debug stream which are kept, if the config has no Debug section
+DEFAULT_DEBUG_WINDOW = 60.
+
+
+# B = c0 + c1 * V_Hall
+HALL_CALIBRATION = [2.545442, -1108.27859]
+
+
 def hall_to_B(v_hall):
-    return 2.545442 - 1108.27859 * v_hall
+    return HALL_CALIBRATION[0] + HALL_CALIBRATION[1] * v_hall
 
 # def T_cryo_to_T_sample(T_cryo):
 #     return 5.26277 + 0.99971 * T_cryo
 
 class AbstractDataStore(ABC):
-    def __init__(self, power_type: str = 'V'):
-        self.V_hall_list = []
-        self.magnet_B_list = []
-        self.oled_list = []
-        self.I_photo_list = []
+    COLUMNS = ['V_Hall', 'OLED', 'I_Photo']
+    # not stored, computed from a stored column when needed: name -> (source, calibration)
+    DERIVED_COLUMNS = {'B': ('V_Hall', HALL_CALIBRATION)}
+    CSV_FORMATS: dict[str, str] = {}
+    # columns plotted over the sample index, decimated for the plots on ingest
+    ENVELOPE_COLUMNS = ['V_Hall', 'OLED', 'I_Photo']
+    # columns averaged over the B grid for the result plots
+    BINNED_COLUMNS = ['OLED', 'I_Photo']
+    # index of the OLED signal in the device stream for each power type
+    OLED_STREAM_IDX = {'V': 1, 'I': 3}
+    # the device batches are stored and processed (plot pyramid, B, ramps, binned signals and
+    # recording) in blocks of STAGE_BLOCK samples or at the latest after STAGE_INTERVAL seconds,
+    # so the fixed cost of the numpy calls is paid per block instead of per stream read
+    STAGE_BLOCK = 1 << 16
+    STAGE_INTERVAL = 0.2
+
+    def __init__(self, power_type: str = 'V', window: int | None = None):
+        """window: keep only the newest window samples (e.g. for the endless debug stream)"""
+        # the plots and the online analysis read the store without locking from the GUI thread
+        if window:
+            self.store = RingBuffer(self.COLUMNS, window)
+        else:
+            self.store = ColumnStore(self.COLUMNS)
+        self.derived = DerivedColumns(self.DERIVED_COLUMNS)
+        self.pyramid = MinMaxPyramid(self.ENVELOPE_COLUMNS, self.store)
+        self.binned = BinnedAccumulator(self.BINNED_COLUMNS)
+        # index of the ramps and events (sample indices) for the processing, see get_metadata
+        self.ramps = RampTracker()
+        self.events: list[list] = []
+        self.recorder: StreamRecorder | None = None
+        self.saved_rows = 0  # number of samples which were saved by to_file
+        self.timing = RateEstimator()
+        # device batches which are not stored yet, see receive and process
+        self._pending: deque[np.ndarray] = deque()
+        self._received = 0
+        self._processed = 0
+        self._processed_at = monotonic()
+        self._process_lock = threading.Lock()
         self.power_type = power_type
+        self.oled_idx = self.OLED_STREAM_IDX.get(power_type)
+        if self.oled_idx is None:
+            logger.warn('Power type not defined')
         self.plot_idx = 0
 
-    def listen(self, stream_data_list: list[tuple[float, float, float, float]]) -> None:
-        raise NotImplementedError
-    
-    def to_file(self, dir_path: str):
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @property
+    def total(self) -> int:
+        """Number of received samples, i.e. the index of the next sample. The store may lag behind."""
+        return self._received
+
+    @property
+    def V_hall(self) -> np.ndarray:
+        return self.column('V_Hall')
+
+    @property
+    def magnet_B(self) -> np.ndarray:
+        return self.column('B')
+
+    @property
+    def oled(self) -> np.ndarray:
+        return self.column('OLED')
+
+    @property
+    def I_photo(self) -> np.ndarray:
+        return self.column('I_Photo')
+
+    def column(self, name: str) -> np.ndarray:
+        """A stored or derived column, derived columns are cached unless the store is windowed."""
+        self.process()
+        if name not in self.derived:
+            return self.store[name]
+        if isinstance(self.store, RingBuffer):
+            return self.derived.compute(name, self.store[self.derived.source(name)])
+        return self.derived.get(name, self.store)
+
+    def stream_columns(self, stream_data: np.ndarray) -> dict[str, np.ndarray]:
+        """Maps a (n, 4) device batch to the stored columns."""
+        return {
+            'V_Hall': stream_data[:, 0],
+            'OLED': None if self.oled_idx is None else stream_data[:, self.oled_idx],
+            'I_Photo': stream_data[:, 2],
+        }
+
+    def listen(self, stream_data: np.ndarray) -> None:
         raise NotImplementedError
 
+    def receive(self, stream_data: np.ndarray) -> None:
+        """
+        Queues a device batch, the queue is stored and processed by process when it holds
+        STAGE_BLOCK samples or STAGE_INTERVAL seconds after the last process. Only one thread
+        may receive.
+        """
+        self._pending.append(stream_data)
+        self._received += len(stream_data)
+        if (self._received - self._processed >= self.STAGE_BLOCK
+                or monotonic() - self._processed_at >= self.STAGE_INTERVAL):
+            self.process()
+
+    def process(self) -> None:
+        """
+        Stores the queued batches and processes them. Called by receive and by any thread before
+        the store or the results of the processing are read, e.g. by snapshot and get_metadata.
+        """
+        with self._process_lock:
+            self._processed_at = monotonic()
+            # deque.popleft is thread safe, batches which arrive meanwhile wait for the next process
+            batches = [self._pending.popleft() for _ in range(len(self._pending))]
+            if not batches:
+                return
+            for batch in batches:
+                if hasattr(batch, 't'):
+                    self.timing.update(batch.t, batch.index, len(batch))
+            stream_data = np.concatenate(batches)
+            self.append(self.stream_columns(stream_data), len(stream_data))
+            self._processed += len(stream_data)
+
+    def append(self, columns: dict, n_samples: int) -> None:
+        """Stores the samples and runs the plot pyramid, B, ramps, binned signals and recording on them."""
+        self.store.append(columns, n_samples)
+        self.pyramid.append(columns, n_samples)
+        # only the block is derived for the online analysis, the store keeps V_Hall, the ramps
+        # and the binning work in float64
+        B = self.derived.compute('B', columns['V_Hall']).astype(np.float64)
+        self.binned.append(B, columns, self.ramps.directions(B))
+        if self.recorder:
+            self.recorder.record(columns, n_samples)
+
+    def snapshot(self) -> dict[str, np.ndarray]:
+        """
+        The current samples, unaffected by further streaming. Views of the column store are
+        stable (appends only write behind them), the ring buffer of a windowed store is copied.
+        """
+        self.process()
+        if isinstance(self.store, RingBuffer):
+            while True:
+                snapshot = self.store.snapshot()
+                columns = {name: values.copy() for name, values in snapshot.columns.items()}
+                if snapshot.valid():
+                    return columns
+        return self.store.view()
+
+    def to_file(self, dir_path: str, metadata: dict | None = None, snapshot: dict[str, np.ndarray] | None = None,
+                progress=None, cancelled=None, compression: int = 0, csv: bool = False) -> bool:
+        """
+        Moves the recording to dir_path, the data (snapshot, default: all samples) is only written
+        if nothing was recorded. Returns False if cancelled() stopped the writing.
+        csv: additionally export the data as data.csv, for tools which do not read data.mfeb.
+        """
+        file_path = os.path.join(dir_path, 'data.mfeb')
+        if snapshot is None:
+            snapshot = self.snapshot()
+        n_samples = len(next(iter(snapshot.values())))
+        metadata = self.get_metadata(n_samples) | (metadata or {})
+        recorder = self.recorder
+        if recorder and recorder.move_to(file_path, metadata, n_rows=n_samples):
+            if progress:
+                progress(1.)
+        elif not write_measurement(file_path, snapshot, metadata, progress=progress, cancelled=cancelled,
+                                   compression=compression, derived=metadata['derived']):
+            return False
+        elif recorder and recorder.finalized and recorder.n_rows <= n_samples:
+            # the closed recording holds nothing which was not saved now
+            recorder.discard()
+        self.saved_rows = max(self.saved_rows, n_samples)
+        if csv:
+            save_csv(os.path.join(dir_path, 'data.csv'), self.csv_columns(snapshot), self.CSV_FORMATS)
+        return True
+
+    def get_metadata(self, n_samples: int | None = None) -> dict:
+        """n_samples: number of saved samples, default: all"""
+        self.process()
+        n_samples = len(self.store) if n_samples is None else n_samples
+        metadata = {'power_type': self.power_type, 'n_samples': n_samples, 'derived': self.derived.to_dict()}
+        sample_rate = self.timing.mean_rate
+        if np.isfinite(sample_rate):
+            metadata['sample_rate'] = sample_rate
+        metadata['streams'] = self.timing.get_segments()
+        if not isinstance(self.store, RingBuffer):  # the indices only fit if all samples are stored
+            metadata['ramp_turns'] = [turn for turn in self.ramps.turns if turn < n_samples]
+            metadata['events'] = [event for event in self.events if event[1] <= n_samples]
+        return metadata
+
+    def mark(self, event: str) -> None:
+        """Records that event (e.g. magnet_on) happened before the next sample."""
+        self.events.append([event, self.total])
+        if event == 'magnet_on':
+            self.ramps.restart(at=self.total)
+
+    def csv_columns(self, snapshot: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        """The columns of data.csv, which has one value per sample for every column."""
+        return derive_columns(snapshot, self.derived.to_dict())
+
+    def to_csv(self, dir_path: str):
+        file_path = os.path.join(dir_path, 'data.csv')
+        save_csv(file_path, self.csv_columns(self.snapshot()), self.CSV_FORMATS)
+
     def reset_plot(self):
-        if self.V_hall_list:
-            self.plot_idx = len(self.V_hall_list)-1
+        if self.total:
+            self.plot_idx = self.total-1
+        self.process()
+        self.binned.reset()
 
 class DataStore(AbstractDataStore):
-    def __init__(self, power_type):
+    def __init__(self, power_type, window: int | None = None):
         logger.info(f'init data store with {power_type}')
-        super().__init__(power_type)
+        super().__init__(power_type, window)
         self.stages = {}
 
-    def listen(self, stream_data_list: list[tuple[float, float, float, float]]) -> None:
-        for stream_data in stream_data_list:
-            self.V_hall_list.append(stream_data[0])
-            self.magnet_B_list.append(hall_to_B(stream_data[0]))
-            self.I_photo_list.append(stream_data[2])
-            if self.power_type == 'V':
-                self.oled_list.append(stream_data[1])
-            elif self.power_type == 'I':
-                self.oled_list.append(stream_data[3])
-            else:
-                logger.warn('Power type not defined')
-
-    def to_file(self, dir_path: str):
-        file_path = os.path.join(dir_path, f'data.csv')
-        with open(file_path, 'w', newline='') as f:
-            writer = csv.writer(f)
-            header = ['V_Hall', 'B', 'OLED', 'I_Photo',]
-            writer.writerow(header)
-            writer.writerows(zip(self.V_hall_list, self.magnet_B_list, self.oled_list, self.I_photo_list))
+    def listen(self, stream_data: np.ndarray) -> None:
+        self.receive(stream_data)
         
 class CryoDataStore(AbstractDataStore):
-    def __init__(self, power_type):
-        super().__init__(power_type)
+    # only change between the measurement steps, kept as segment table instead of per sample
+    SEGMENT_COLUMNS = ['Channel', 'Temp', 'Temp_sample']
+    CSV_FORMATS = {'Channel': '%.0f', 'Temp': '%.3f', 'Temp_sample': '%.3f'}
+
+    def __init__(self, power_type, window: int | None = None):
+        super().__init__(power_type, window)
+        self.segments = SegmentTable(self.SEGMENT_COLUMNS)
         self.temp = None
         self.temp_sample = None
         self.current_channel: int | None = None
-        self.temp_list = []
-        self.temp_sample_list = []
-        self.channel_list = []
-
-    def listen(self, stream_data_list: list[tuple[float, float, float, float]]) -> None:
-        for stream_data in stream_data_list:
-            self.V_hall_list.append(stream_data[0])
-            self.magnet_B_list.append(hall_to_B(stream_data[0]))
-            self.I_photo_list.append(stream_data[2])
-            if self.power_type == 'V':
-                self.oled_list.append(stream_data[1])
-            elif self.power_type == 'I':
-                self.oled_list.append(stream_data[3])
-            self.channel_list.append(self.current_channel)
-            self.temp_list.append(self.temp)
-            self.temp_sample_list.append(self.temp_sample)
-    
-    def to_file(self, dir_path: str):
-        file_path = os.path.join(dir_path, f'data.csv')
-        with open(file_path, 'w', newline='') as f:
-            writer = csv.writer(f)
-            header = ['V_Hall', 'B', 'OLED', 'I_Photo', 'Channel', 'Temp', 'Temp_sample']
-            writer.writerow(header)
-            writer.writerows(zip(self.V_hall_list, self.magnet_B_list, self.oled_list, self.I_photo_list, self.channel_list, self.temp_list, self.temp_sample_list))
+        # (channel, temp, temp_sample) of the last received and of the last stored batch
+        self._segment_values = (None, None, None)
+        self._stored_segment_values = (None, None, None)
+        self._segment_changes: deque[tuple[int, tuple]] = deque()
+
+    def listen(self, stream_data: np.ndarray) -> None:
+        # only the changes are queued, with the index of the first sample they apply to
+        values = (self.current_channel, self.temp, self.temp_sample)
+        if values != self._segment_values:
+            self._segment_changes.append((self.total, values))
+            self._segment_values = values
+        self.receive(stream_data)
+
+    def append(self, columns: dict, n_samples: int) -> None:
+        # the segments first: they always cover the samples which are visible in the store
+        stop = self.segments.total + n_samples
+        while self._segment_changes and self._segment_changes[0][0] < stop:
+            start, values = self._segment_changes.popleft()
+            self._append_segment(start - self.segments.total)
+            self._stored_segment_values = values
+        self._append_segment(stop - self.segments.total)
+        super().append(columns, n_samples)
+
+    def _append_segment(self, n_samples: int) -> None:
+        channel, temp, temp_sample = self._stored_segment_values
+        self.segments.append({'Channel': channel, 'Temp': temp, 'Temp_sample': temp_sample}, n_samples)
+
+    def get_metadata(self, n_samples: int | None = None) -> dict:
+        metadata = super().get_metadata(n_samples)
+        metadata['segments'] = self.segments.to_dict(metadata['n_samples'])
+        return metadata
+
+    def csv_columns(self, snapshot: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        n_samples = len(next(iter(snapshot.values())))
+        columns = super().csv_columns(snapshot)
+        return columns | {column: self.segments.expand(column, n_samples) for column in self.SEGMENT_COLUMNS}
 
 class MeasureMode(Enum):
     """
@@ -121,7 +328,9 @@ class Experiment:
         # read yaml configuration file
         self.read_config(config_file)
         self.power_type = self.config['OLED']['power_type']
-        self.data_store = DataStore(self.power_type)
+        recover_recordings(RECORDING_DIR)
+        self.data_store: AbstractDataStore | None = None
+        self.data_store = self.new_data_store(DataStore)
         self.stages = {}
         self.magnet = None
         self.oled = None
@@ -129,11 +338,44 @@ class Experiment:
         self.pt100 = None
         self.cryo_relais = None
         self.daq = None
+        self.daq_idn: str | None = None
         self.running = False
         self.progress = 0
         self.finish_callback: typing.Callable | None = None
         self.progress_callback: typing.Callable | None = None
 
+    def new_data_store(self, store_type: type[AbstractDataStore], window: int | None = None) -> AbstractDataStore:
+        """
+        Creates a data store which records to RECORDING_DIR, the previous recording is closed.
+        A windowed data store only keeps the newest samples and is not recorded.
+        """
+        if self.data_store and self.data_store.recorder:
+            self.data_store.process()
+            recorder = self.data_store.recorder
+            if recorder.n_rows <= self.data_store.saved_rows:
+                # moved by the save, or saved with write_measurement and only a duplicate
+                recorder.discard()
+            else:
+                recorder.finalize(self.data_store.get_metadata() | {'saved': False})
+        data_store = store_type(self.power_type, window=window)
+        if not window:
+            data_store.recorder = StreamRecorder.in_dir(RECORDING_DIR, data_store.COLUMNS,
+                                                        compression=self.saving_settings()['compression'],
+                                                        derived=data_store.derived.to_dict())
+        return data_store
+
+    def saving_settings(self) -> dict:
+        """Saving section of the config with the defaults of the options older configs do not have."""
+        return {'compression': 0, 'csv': False} | (self.config.get('Saving') or {})
+
+    def debug_window(self) -> int:
+        """Number of samples kept by the debug stream, from Debug: window [s] or samples in the config."""
+        settings = self.config.get('Debug') or {}
+        if settings.get('samples'):
+            return int(settings['samples'])
+        frame_rate = float(self.config['ADC']['drate']) / N_CHANNELS
+        return max(1, int(np.ceil(settings.get('window', DEFAULT_DEBUG_WINDOW) * frame_rate)))
+
     def read_config(self, path: str):
         with open(path, 'r') as file:
             self.config = yaml.safe_load(file)
@@ -185,7 +427,7 @@ class Experiment:
 
     def cryo_routine(self, settings):
         logger.info('Cryo routine started')
-        self.data_store = CryoDataStore(self.power_type)
+        self.data_store = self.new_data_store(CryoDataStore)
         manual_temp_mode = settings['temp']['manual']
         self.init_cryo_system(manual_temp_mode)
         self.init_pt100()
@@ -256,6 +498,7 @@ class Experiment:
         self.power_oled(self.config['OLED'], wait=True)
         self.wait(1)
         self.start_stream(self.data_store.listen)
+        self.data_store.mark('magnet_on')
         self.magnet.turn_on()
         self.wait_n_ramps()
         self.stop_stream(self.data_store.listen)
@@ -264,7 +507,7 @@ class Experiment:
 
     def standard_routine(self):
         logger.info('Standard routine started')
-        self.data_store = DataStore(self.config['OLED']['power_type'])
+        self.data_store = self.new_data_store(DataStore)
         self.measure()
 
     def run_experiment(self):
@@ -287,8 +530,15 @@ class Experiment:
             self.finish_callback()
         logger.info('Experiment finished')
 
-    def debug_stream(self, listener) -> None:
+    def debug_stream(self, listener=None) -> None:
+        """
+        Streams until stop_stream. Without a listener the stream goes into a new data store which
+        only keeps the newest debug_window() samples, so memory and plot cost stay constant.
+        """
         channel = None
+        if listener is None:
+            self.data_store = self.new_data_store(DataStore, window=self.debug_window())
+            listener = self.data_store.listen
         self.data_store.reset_plot()
         if self.config['Cryo']['enabled']:
             self.init_cryo_relais()
@@ -308,22 +558,40 @@ class Experiment:
         if self.daq:
             self.daq.stop_stream()
             self.daq.remove_stream_listener(listener) 
+        if self.data_store:
+            self.data_store.process()
 
     def wait_n_ramps(self):
         f = self.magnet.frequency
         sleep_time = self.config['Magnet']['n_ramps']/f 
         self.wait(sleep_time)
 
-    def save(self, path: str, probe_name: str):
+    def save(self, path: str, probe_name: str, data_store: AbstractDataStore | None = None,
+             snapshot: dict[str, np.ndarray] | None = None, progress=None, cancelled=None) -> str | None:
+        """
+        Saves data_store (default: the current one) or a snapshot of it, see AbstractDataStore.to_file.
+        Returns the measurement directory or None if cancelled.
+        """
+        data_store = data_store or self.data_store
         date_dir_path = create_date_dir(path)
         experiment_dir = create_dir(date_dir_path, probe_name)
-        self.data_store.to_file(experiment_dir)
         save_config_file(experiment_dir)
+        with open(CONFIG_FILE, 'r') as file:
+            config = yaml.safe_load(file)
+        metadata = {'probe_name': probe_name, 'saved_at': datetime.now().isoformat(timespec='seconds'),
+                    'daq': self.daq_idn, 'config': config}
+        settings = self.saving_settings()
+        if not data_store.to_file(experiment_dir, metadata, snapshot=snapshot, progress=progress, cancelled=cancelled,
+                                  compression=settings['compression'], csv=settings['csv']):
+            logger.info(f'Saving to {experiment_dir} cancelled')
+            return None
+        return experiment_dir
 
     def load_daq(self, port: str) -> str:
         self.daq = AnalogDaq(port)
         self.daq.initialize()
-        return self.daq.getIDN()
+        self.daq_idn = self.daq.getIDN()
+        return self.daq_idn
 
     def daq_setparameters(self):
         self.daq.setParamters(self.gain_code, self.drate_code)
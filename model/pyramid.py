@@ -0,0 +1,161 @@
+import numpy as np
+from model.ring_buffer import RingBuffer
+from model.column_store import ColumnStore
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class MinMaxPyramid:
+    """
+    Multi-level min/max decimation of a stream for plotting.
+
+    Level k holds the min and max of bins of base * factor**k samples. The levels are kept up
+    to date incrementally: only complete bins are pushed into the level, the remainder waits in
+    a small tail until the next block. envelope() picks the coarsest level which still resolves
+    the requested range with max_points and groups its bins to about max_points, so the cost of
+    a redraw depends on the plot width, not on the length of the run. Ranges too short for the
+    finest level and the newest samples, which are not reduced yet, are reduced from the raw
+    samples on the fly.
+    The levels are buffers of the same kind as the raw samples: ring buffers which span the
+    window of a raw ring buffer (constant memory), or growing column stores which cover the whole
+    run of a raw column store (24 bytes per bin of the three columns, the finest level adds
+    ~0.1 bytes per sample).
+    Like the raw buffers, the levels are written by one thread at a time and read without a lock.
+    """
+    def __init__(self, columns: list[str], raw: RingBuffer | ColumnStore, base: int = 256, factor: int = 8,
+                 min_bins: int = 512, n_levels: int = 5):
+        """
+        min_bins: bins of the coarsest level of a raw ring buffer
+        n_levels: number of levels of a raw column store
+        """
+        self.columns = list(columns)
+        self.raw = raw
+        level_columns = [f'{column}_{stat}' for column in self.columns for stat in ('min', 'max')]
+        if isinstance(raw, RingBuffer):
+            self.bin_sizes: list[int] = []
+            bin_size = base
+            while raw.capacity // bin_size >= min_bins:
+                self.bin_sizes.append(bin_size)
+                bin_size *= factor
+            self.levels = [RingBuffer(level_columns, raw.capacity // size + 2) for size in self.bin_sizes]
+        else:
+            self.bin_sizes = [base * factor**k for k in range(n_levels)]
+            self.levels = [ColumnStore(level_columns, chunk_size=min_bins) for _ in self.bin_sizes]
+        # (min, max) of the samples (level 0) or bins (higher levels) which do not fill a bin of
+        # the level yet, as (n_columns, n) arrays
+        self._tails: list[tuple[np.ndarray, np.ndarray] | None] = [None for _ in self.levels]
+
+    def append(self, columns: dict[str, np.ndarray | float | None], n_samples: int) -> None:
+        """The next n_samples samples of the raw buffer, best in blocks of many samples."""
+        if not self.levels or n_samples <= 0:
+            return
+        # all columns are reduced together, the numpy calls per block do not grow with the columns
+        values = np.empty((len(self.columns), n_samples), dtype=np.float32)
+        for i, column in enumerate(self.columns):
+            value = columns.get(column)
+            values[i] = np.nan if value is None else value
+        mins = maxs = values
+        previous_size = 1
+        for level_idx, (size, level) in enumerate(zip(self.bin_sizes, self.levels)):
+            mins, maxs = self._reduce(level_idx, mins, maxs, size // previous_size)
+            previous_size = size
+            n_bins = mins.shape[1]
+            if not n_bins:
+                return
+            bins = {}
+            for i, column in enumerate(self.columns):
+                bins[f'{column}_min'] = mins[i]
+                bins[f'{column}_max'] = maxs[i]
+            level.append(bins, n_bins)
+
+    def _reduce(self, level_idx: int, mins: np.ndarray, maxs: np.ndarray,
+                factor: int) -> tuple[np.ndarray, np.ndarray]:
+        """Reduces the tail plus the new values in complete groups of factor, keeps the rest as tail."""
+        tail = self._tails[level_idx]
+        if tail is not None:
+            mins = np.concatenate((tail[0], mins), axis=1)
+            maxs = np.concatenate((tail[1], maxs), axis=1)
+        n_full = mins.shape[1] // factor * factor
+        self._tails[level_idx] = (mins[:, n_full:].copy(), maxs[:, n_full:].copy()) if n_full < mins.shape[1] else None
+        if not n_full:
+            return mins[:, :0], maxs[:, :0]
+        # fmin/fmax ignore NaN (lost frames) unless the whole bin is NaN
+        starts = np.arange(0, n_full, factor)
+        return (np.fmin.reduceat(mins[:, :n_full], starts, axis=1),
+                np.fmax.reduceat(maxs[:, :n_full], starts, axis=1))
+
+    def clear(self) -> None:
+        for level in self.levels:
+            level.clear()
+        self._tails = [None for _ in self.levels]
+
+    def envelope(self, column: str, start: int, stop: int | None = None,
+                 max_points: int = 2000) -> tuple[np.ndarray, np.ndarray]:
+        """
+        x (sample index) and y of the column for the samples [start, stop), at most about
+        max_points points: raw samples if they fit, otherwise the min and max of each bin.
+        """
+        total = self.raw.total
+        stop = total if stop is None else min(stop, total)
+        if isinstance(self.raw, RingBuffer):
+            start = max(start, total - self.raw.capacity)
+        start = max(start, 0)
+        n = stop - start
+        if n <= max_points or not self.levels:
+            return self._raw(column, start, stop, 1)
+        bin_size = 2 * n / max_points
+        if bin_size < self.bin_sizes[0]:
+            # finer than the pyramid, a few bins of the finest level worth of samples
+            return self._raw(column, start, stop, int(np.ceil(bin_size)))
+        level_idx = max(i for i, size in enumerate(self.bin_sizes) if size <= bin_size)
+        xs, ys = [], []
+        pos = start
+        # the coarse level first: the finer levels and the raw samples are always at least as far
+        for i in range(level_idx, -1, -1):
+            size = self.bin_sizes[i]
+            first, bins = _span(self.levels[i], pos // size, stop // size)
+            lo, hi = bins[f'{column}_min'], bins[f'{column}_max']
+            if not len(lo):
+                continue
+            # only the coarse level has more bins than needed
+            x, y = _min_max(lo, hi, max(1, -(-2 * len(lo) // max_points)) if i == level_idx else 1)
+            xs.append((first + x) * size)
+            ys.append(y)
+            pos = (first + len(lo)) * size
+        # the newest samples, which are not reduced yet
+        x, y = self._raw(column, pos, stop, int(np.ceil(bin_size)))
+        xs.append(x)
+        ys.append(y)
+        return np.concatenate(xs), np.concatenate(ys)
+
+    def _raw(self, column: str, start: int, stop: int, bin_size: int) -> tuple[np.ndarray, np.ndarray]:
+        """The raw samples [start, stop), or their min and max in bins of bin_size if bin_size > 1."""
+        first, samples = _span(self.raw, start, stop)
+        values = samples[column]
+        if bin_size <= 1 or not len(values):
+            return np.arange(first, first + len(values)), values
+        x, y = _min_max(values, values, bin_size)
+        return first + x, y
+
+
+def _span(buffer: RingBuffer | ColumnStore, start: int, stop: int) -> tuple[int, dict[str, np.ndarray]]:
+    """Index of the first value and views of all columns for [start, stop), clipped to the buffered values."""
+    if isinstance(buffer, RingBuffer):
+        snapshot = buffer.snapshot(start)
+        n = max(0, min(len(snapshot), stop - snapshot.start))
+        return snapshot.start, {name: values[:n] for name, values in snapshot.columns.items()}
+    start = max(start, 0)
+    return start, buffer.view(start, max(start, min(stop, len(buffer))))
+
+
+def _min_max(lo: np.ndarray, hi: np.ndarray, group: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    x (offset of the first value) twice and y (min, max) of groups of group values, the last
+    group may be incomplete.
+    """
+    starts = np.arange(0, len(lo), group)
+    y = np.empty(2 * len(starts), dtype=np.float32)
+    y[0::2] = np.fmin.reduceat(lo, starts)
+    y[1::2] = np.fmax.reduceat(hi, starts)
+    return np.repeat(starts, 2), y
@@ -0,0 +1,121 @@
+import threading
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RampTracker:
+    """
+    Follows the direction of the magnet ramps in the B samples as they arrive.
+
+    The direction changes when B has moved more than hysteresis back from the last extremum,
+    which keeps the noise of B around the turning points from toggling it. The sample index of
+    every extremum at which the direction changed is kept in turns, these are the boundaries of
+    the ramps. A turn back within min_distance samples of the previous turn is noise (a ramp
+    slower than the noise), both turns are discarded. Until B has moved by more than hysteresis
+    at all (magnet still off) the direction is unknown and the samples count as UP.
+    directions() is called by the ingest thread, restart() may be called by any other thread.
+    The samples may reach directions() later than they are received (in blocks, see
+    AbstractDataStore.receive), so a restart refers to a sample index instead of a call.
+    """
+    UP, DOWN = 0, 1
+    # samples scanned at once: after a turn only the rest of the scan is scanned again, not the
+    # rest of a long block
+    SCAN = 4096
+
+    def __init__(self, hysteresis: float = 2., min_distance: int = 1000):
+        self.hysteresis = hysteresis
+        self.min_distance = min_distance
+        self.turns: list[int] = []
+        self.total = 0
+        self._restart_at: int | None = None
+        self._restart_lock = threading.Lock()
+        self._reset()
+
+    def restart(self, at: int | None = None) -> None:
+        """
+        Forgets the direction from the sample with index at on (default: the next sample passed
+        to directions()), e.g. when the magnet is turned on. The turns are kept.
+        """
+        with self._restart_lock:
+            self._restart_at = -1 if at is None else at
+
+    def _reset(self) -> None:
+        self.direction: int | None = None
+        self._extremum = np.nan
+        self._extremum_idx = 0
+        self._low = self._high = np.nan
+
+    def directions(self, B: np.ndarray) -> np.ndarray:
+        """Ramp direction of every sample, only loops over the turning points."""
+        B = np.asarray(B, dtype=np.float64)
+        with self._restart_lock:
+            restart_at = self._restart_at
+            if restart_at is not None and restart_at < self.total + len(B):
+                self._restart_at = None
+            else:
+                restart_at = None
+        if restart_at is None:
+            return self._directions(B)
+        split = max(0, restart_at - self.total)
+        head = self._directions(B[:split])
+        self._reset()
+        return np.concatenate((head, self._directions(B[split:])))
+
+    def _directions(self, B: np.ndarray) -> np.ndarray:
+        directions = np.empty(len(B), dtype=np.int8)
+        pos = 0
+        while pos < len(B):
+            segment = B[pos:pos + self.SCAN]
+            if self.direction is None:
+                pos += self._find_direction(segment, directions[pos:])
+                continue
+            # running extremum since the last turn, monotonic
+            if self.direction == self.UP:
+                extremum = np.fmax.accumulate(segment)
+                np.fmax(extremum, self._extremum, out=extremum)
+            else:
+                extremum = np.fmin.accumulate(segment)
+                np.fmin(extremum, self._extremum, out=extremum)
+            if self.direction == self.UP:
+                turned = np.flatnonzero(segment < extremum - self.hysteresis)
+            else:
+                turned = np.flatnonzero(segment > extremum + self.hysteresis)
+            end = int(turned[0]) if len(turned) else len(segment)
+            directions[pos:pos + end] = self.direction
+            if end and extremum[end - 1] != self._extremum:
+                # first sample at which the new extremum was reached, a binary search as it is monotonic
+                if self.direction == self.UP:
+                    first = np.searchsorted(extremum[:end], extremum[end - 1], side='left')
+                else:
+                    first = end - np.searchsorted(extremum[end - 1::-1], extremum[end - 1], side='right')
+                self._extremum_idx = self.total + pos + int(first)
+            if len(turned):
+                if self.turns and self._extremum_idx - self.turns[-1] < self.min_distance:
+                    self.turns.pop()
+                else:
+                    self.turns.append(self._extremum_idx)
+                self.direction = 1 - self.direction
+                self._extremum = segment[end]
+                self._extremum_idx = self.total + pos + end
+            else:
+                self._extremum = extremum[-1]
+            pos += end
+        self.total += len(B)
+        return directions
+
+    def _find_direction(self, segment: np.ndarray, directions: np.ndarray) -> int:
+        """Consumes the samples before B has moved by more than hysteresis, returns their number."""
+        low = np.fmin.accumulate(np.concatenate(([self._low], segment)))[1:]
+        high = np.fmax.accumulate(np.concatenate(([self._high], segment)))[1:]
+        moved = np.flatnonzero(high - low > self.hysteresis)
+        end = int(moved[0]) if len(moved) else len(segment)
+        directions[:end] = self.UP
+        if len(moved):
+            # the sample which exceeded the range is the first extremum of the new direction
+            self.direction = self.UP if segment[end] == high[end] else self.DOWN
+        else:
+            self._low, self._high = low[-1], high[-1]
+        return end
+
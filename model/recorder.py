@@ -0,0 +1,163 @@
+import os
+import glob
+import shutil
+import threading
+from datetime import datetime
+from time import monotonic
+import numpy as np
+from utils.mfe_file import RECORDING_SUFFIX, MeasurementWriter, recover
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StreamRecorder:
+    """
+    Writes the ingested stream batches to an append-only measurement file while streaming.
+
+    Rows are collected in a small buffer and written as one chunk when chunk_rows are reached
+    or flush_interval has passed, the file is fsynced every fsync_interval seconds. After a crash
+    the file is readable up to the last complete chunk (see recover_recordings).
+    The file is only created with the first batch, so a data store which never streams leaves
+    nothing behind.
+    """
+    DEFAULTS = {
+        'chunk_rows': 1 << 14,
+        'flush_interval': 0.5,
+        'fsync_interval': 2.,
+        'compression': 0,
+    }
+
+    def __init__(self, path: str, columns: list[str], chunk_rows: int | None = None,
+                 flush_interval: float | None = None, fsync_interval: float | None = None,
+                 compression: int | None = None, derived: dict | None = None):
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows or self.DEFAULTS['chunk_rows']
+        self.flush_interval = self.DEFAULTS['flush_interval'] if flush_interval is None else flush_interval
+        self.fsync_interval = self.DEFAULTS['fsync_interval'] if fsync_interval is None else fsync_interval
+        self.compression = self.DEFAULTS['compression'] if compression is None else compression
+        self.derived = derived
+        self.writer: MeasurementWriter | None = None
+        self.finalized = False
+        self.moved = False
+        self._buffer = np.empty((len(self.columns), self.chunk_rows), dtype=np.float32)
+        self._n_buffered = 0
+        self._last_flush = monotonic()
+        self._last_fsync = monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def in_dir(cls, dir_path: str, columns: list[str], **kwargs) -> 'StreamRecorder':
+        os.makedirs(dir_path, exist_ok=True)
+        name = datetime.now().strftime('%Y%m%d_%H%M%S_%f') + RECORDING_SUFFIX
+        return cls(os.path.join(dir_path, name), columns, **kwargs)
+
+    @property
+    def n_rows(self) -> int:
+        written = self.writer.n_rows if self.writer else 0
+        return written + self._n_buffered
+
+    def record(self, columns: dict[str, np.ndarray | float | None], n_samples: int) -> None:
+        """Same arguments as ColumnStore.append."""
+        with self._lock:
+            if self.finalized or n_samples <= 0:
+                return
+            if self.writer is None:
+                self.writer = MeasurementWriter(self.path, self.columns, compression=self.compression,
+                                                derived=self.derived)
+            start = 0
+            while start < n_samples:
+                n = min(n_samples - start, self.chunk_rows - self._n_buffered)
+                stop = self._n_buffered + n
+                for idx, name in enumerate(self.columns):
+                    value = columns.get(name)
+                    if value is None:
+                        value = np.nan
+                    elif np.ndim(value):
+                        value = value[start:start + n]
+                    self._buffer[idx, self._n_buffered:stop] = value
+                self._n_buffered = stop
+                start += n
+                if self._n_buffered == self.chunk_rows:
+                    self._write_buffer()
+            if monotonic() - self._last_flush > self.flush_interval:
+                self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        self.writer.write_chunk(self._buffer[:, :self._n_buffered])
+        self._n_buffered = 0
+        now = monotonic()
+        fsync = now - self._last_fsync > self.fsync_interval
+        self.writer.flush(fsync)
+        self._last_flush = now
+        if fsync:
+            self._last_fsync = now
+
+    def finalize(self, metadata: dict | None = None) -> str | None:
+        """
+        Writes the remaining rows and the metadata trailer. Returns the path or None if empty.
+        Once finalized (e.g. by a move_to of the save thread) further calls change nothing.
+        """
+        with self._lock:
+            return self._finalize(metadata)
+
+    def _finalize(self, metadata: dict | None) -> str | None:
+        if self.writer is None:
+            self.finalized = True
+            return None
+        if not self.finalized:
+            self.finalized = True
+            if self._n_buffered:
+                self.writer.write_chunk(self._buffer[:, :self._n_buffered])
+                self._n_buffered = 0
+            self.writer.close(metadata)
+        return self.path
+
+    def move_to(self, file_path: str, metadata: dict | None = None, n_rows: int | None = None) -> bool:
+        """
+        Finalizes the recording with metadata and moves it to file_path. Returns False, without
+        changing anything, if the recording was already finalized, nothing was recorded or it
+        does not hold exactly n_rows rows. Check and move are atomic, a finalize from another
+        thread waits until the move is done.
+        """
+        with self._lock:
+            if self.finalized or self.writer is None or (n_rows is not None and self.n_rows != n_rows):
+                return False
+            path = self._finalize(metadata)
+            try:
+                os.replace(path, file_path)
+            except OSError:  # e.g. a different drive
+                shutil.move(path, file_path)
+            self.path = file_path
+            self.moved = True
+            return True
+
+    def discard(self) -> None:
+        """Finalizes the recording and deletes it, once its data has been saved elsewhere."""
+        path = self.finalize()
+        if path is None or self.moved:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        logger.info(f'Removed the saved recording {path}')
+
+
+def recover_recordings(dir_path: str) -> list[str]:
+    """
+    Repairs recordings which were left open by a crash, they stay in dir_path and can be
+    processed like a saved measurement.
+    """
+    recovered = []
+    for path in sorted(glob.glob(os.path.join(dir_path, '*' + RECORDING_SUFFIX))):
+        try:
+            n_rows = recover(path, {'saved': False, 'recovered': True})
+        except Exception:
+            logger.error(f'Could not recover {path}', exc_info=True)
+            continue
+        if n_rows is not None:
+            logger.warning(f'Recovered unsaved recording {path} with {n_rows} samples')
+            recovered.append(path)
+    return recovered
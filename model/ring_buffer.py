@@ -0,0 +1,115 @@
+import numpy as np
+from model.column_store import save_csv
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """
+    Fixed-capacity single-producer ring buffer with copy-free snapshots of all columns.
+
+    Every sample is written twice, at slot and at slot + capacity, so the newest n <= capacity
+    samples always form one contiguous slice of the (n_columns, 2 * capacity) array and a
+    snapshot is a set of plain views. The producer (stream thread) publishes the number of
+    written samples only after a batch is complete, so a snapshot never contains a partially
+    written batch and all columns end at the same sample index. No lock is needed: the reader
+    only reads published samples, and Snapshot.valid() tells whether the producer has lapped
+    (overwritten) the oldest samples of a snapshot while it was in use.
+    """
+    def __init__(self, columns: list[str], capacity: int, dtype=np.float32):
+        self.columns = list(columns)
+        self.capacity = int(capacity)
+        self._column_idx = {name: i for i, name in enumerate(self.columns)}
+        self._data = np.full((len(self.columns), 2 * self.capacity), np.nan, dtype=dtype)
+        # both copies of a slot as one (n_columns, 2, capacity) view, written with one assignment
+        self._halves = self._data.reshape(len(self.columns), 2, self.capacity)
+        self._written = 0  # published samples
+        self._claimed = 0  # samples which are being written
+
+    def __len__(self) -> int:
+        return min(self._written, self.capacity)
+
+    @property
+    def total(self) -> int:
+        """Number of samples written since the last clear, i.e. the index of the next sample."""
+        return self._written
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def append(self, columns: dict[str, np.ndarray | float | None], n_samples: int) -> None:
+        """Same arguments as ColumnStore.append. Only one thread may append."""
+        if n_samples <= 0:
+            return
+        skip = max(0, n_samples - self.capacity)  # only the newest capacity samples survive
+        n = n_samples - skip
+        start = self._written + skip
+        self._claimed = start + n
+        pos = 0
+        while pos < n:
+            slot = (start + pos) % self.capacity
+            k = min(n - pos, self.capacity - slot)
+            for name, idx in self._column_idx.items():
+                value = columns.get(name)
+                if value is None:
+                    value = np.nan
+                elif np.ndim(value):
+                    value = value[skip + pos:skip + pos + k]
+                self._halves[idx, :, slot:slot + k] = value
+            pos += k
+        self._written = self._claimed
+
+    def snapshot(self, start: int | None = None, max_samples: int | None = None) -> 'Snapshot':
+        """
+        Views of all columns from sample index start (clipped to the buffered samples) to the
+        newest sample, at most max_samples (default: capacity) of the newest.
+        """
+        written = self._written
+        n = min(written, self.capacity if max_samples is None else min(max_samples, self.capacity))
+        if start is not None:
+            n = min(n, max(0, written - start))
+        end_pos = written % self.capacity + self.capacity
+        views = {name: self._data[idx, end_pos - n:end_pos] for name, idx in self._column_idx.items()}
+        return Snapshot(self, written - n, views)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.snapshot()[column]
+
+    def view(self, start: int | None = None, stop: int | None = None) -> dict[str, np.ndarray]:
+        """ColumnStore.view for the buffered samples, indices are sample indices since the last clear."""
+        snapshot = self.snapshot(start)
+        if stop is None:
+            return snapshot.columns
+        n = max(0, stop - snapshot.start)
+        return {name: values[:n] for name, values in snapshot.columns.items()}
+
+    def to_csv(self, file_path: str, formats: dict[str, str] | None = None):
+        save_csv(file_path, self.view(), formats)
+
+    def clear(self) -> None:
+        """Only while the producer is not appending."""
+        self._written = self._claimed = 0
+        self._data.fill(np.nan)
+
+
+class Snapshot:
+    def __init__(self, buffer: RingBuffer, start: int, columns: dict[str, np.ndarray]):
+        self.buffer = buffer
+        self.start = start
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    @property
+    def stop(self) -> int:
+        return self.start + len(self)
+
+    def valid(self) -> bool:
+        """False if the producer has overwritten samples of this snapshot since it was taken."""
+        return self.buffer._claimed - self.start <= self.buffer.capacity
@@ -0,0 +1,53 @@
+import threading
+import numpy as np
+from utils.mfe_file import expand_segments
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SegmentTable:
+    """
+    Values which only change between measurement steps (cryo channel, temperatures), stored as
+    runs [start, end, value] of sample indices (end exclusive) instead of one value per sample.
+    A run is extended as long as the value stays the same, so the table grows with the number
+    of steps, not with the number of samples.
+    """
+    def __init__(self, columns: list[str]):
+        self.columns = list(columns)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.total = 0
+            self.runs: dict[str, list[list]] = {column: [] for column in self.columns}
+
+    def append(self, values: dict[str, float | int | None], n_samples: int) -> None:
+        """The values of the next n_samples samples."""
+        if n_samples <= 0:
+            return
+        with self._lock:
+            stop = self.total + n_samples
+            for column in self.columns:
+                value = values.get(column)
+                if isinstance(value, np.generic):
+                    value = value.item()  # keep the table JSON serializable
+                runs = self.runs[column]
+                if runs and runs[-1][2] == value:
+                    runs[-1][1] = stop
+                else:
+                    runs.append([self.total, stop, value])
+            self.total = stop
+
+    def to_dict(self, stop: int | None = None) -> dict[str, list[list]]:
+        """Copy of the runs of all columns up to sample stop (default: all), e.g. for the file metadata."""
+        with self._lock:
+            stop = self.total if stop is None else stop
+            return {column: [[start, min(end, stop), value] for start, end, value in runs if start < stop]
+                    for column, runs in self.runs.items()}
+
+    def expand(self, column: str, stop: int | None = None) -> np.ndarray:
+        """The column as one value per sample up to stop, NaN where it was not set."""
+        stop = self.total if stop is None else stop
+        return expand_segments(self.to_dict(stop)[column], 0, stop)
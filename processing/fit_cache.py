@@ -0,0 +1,166 @@
+"""
+Persistent cache of curve fit results.
+
+A fit is identified by the sha256 of everything its result depends on: the code of the model
+function and of the functions it calls, the x and y arrays, p0, bounds and maxfev and the numpy and scipy versions. Each result (params,
+covariance, metrics and whether the fit converged, failed fits are cached as well) is one .npz
+file named after the key in the cache directory, written atomically, so several processes can
+share a cache directory. The access time of an entry is its modification time, when the
+directory grows beyond max_size the least recently used entries are removed.
+"""
+import os
+import json
+import hashlib
+import threading
+from functools import lru_cache
+from types import CodeType, FunctionType
+from typing import Callable
+import numpy as np
+import scipy
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+SUFFIX = ".npz"
+
+
+@lru_cache
+def code_fingerprint(f: Callable) -> str:
+    """
+    Hash of the bytecode, constants and names of f and of the module level functions it calls,
+    so editing a model function or one of its building blocks invalidates its cached fits.
+    """
+    h = hashlib.sha256()
+    functions = [f]
+    seen = {f}
+    while functions:
+        function = functions.pop()
+        h.update(function.__qualname__.encode())
+        codes = [function.__code__]
+        while codes:
+            code = codes.pop()
+            h.update(code.co_code)
+            h.update(repr(code.co_names).encode())
+            for const in code.co_consts:
+                if isinstance(const, CodeType):
+                    codes.append(const)  # comprehensions, lambdas and nested functions
+                else:
+                    h.update(repr(const).encode())
+            for name in code.co_names:
+                called = function.__globals__.get(name)
+                if isinstance(called, FunctionType) and called not in seen:
+                    seen.add(called)
+                    functions.append(called)
+    return h.hexdigest()
+
+
+def fit_key(f: Callable, x_data, y_data, p0, bounds, maxfev: int) -> str:
+    h = hashlib.sha256()
+    for values in (x_data, y_data):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        h.update(str(values.shape).encode())
+        h.update(values.data)
+    bounds = [np.asarray(b, dtype=np.float64).tolist() for b in bounds]
+    p0 = None if p0 is None else np.asarray(p0, dtype=np.float64).tolist()
+    h.update(json.dumps([CACHE_VERSION, code_fingerprint(f), p0, bounds, maxfev, np.__version__, scipy.__version__]).encode())
+    return h.hexdigest()
+
+
+class FitCache:
+    DEFAULTS = {
+        'max_size': 256 * 2**20,  # bytes
+    }
+
+    def __init__(self, directory: str, max_size: int | None = None):
+        self.directory = directory
+        self.max_size = self.DEFAULTS['max_size'] if max_size is None else max_size
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+        self.reset_stats()
+
+    def __getstate__(self):
+        # the fit executor may send models with their cache to other processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _entries(self):
+        return (entry for entry in os.scandir(self.directory) if entry.name.endswith(SUFFIX))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key: str) -> dict | None:
+        """The cached result: params, cov, metrics (dict) and fitted, None if it is not cached."""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                result = {name: data[name] for name in data.files}
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Invalid fit cache entry {path}: {e}")
+            return None
+        names = [str(name) for name in result.pop('metric_names')]
+        result['metrics'] = dict(zip(names, result.pop('metric_values').tolist()))
+        result['fitted'] = bool(result['fitted'])
+        return result
+
+    def put(self, key: str, params, cov, metrics: dict[str, float], fitted: bool) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, params=np.asarray(params, dtype=np.float64), cov=np.asarray(cov, dtype=np.float64),
+                     metric_names=np.array(list(metrics), dtype=str),
+                     metric_values=np.array(list(metrics.values()), dtype=np.float64), fitted=fitted)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Removes the least recently used entries until the cache is at 3/4 of max_size."""
+        # other processes may have added or removed entries, the directory is the reference
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        n_removed = 0
+        for _, size, path in entries:
+            if self._size <= self.max_size * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            n_removed += 1
+        logger.debug(f"Fit cache: removed {n_removed} entries, {self._size / 2**20:.1f} MiB left")
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
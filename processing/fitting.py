@@ -5,6 +5,7 @@ from typing import Callable
 from scipy.optimize import curve_fit
 from abc import ABC
 from typing import Any
+from fit_cache import FitCache, fit_key
 
 import logging
 logger = logging.getLogger(__name__)
@@ -107,6 +108,10 @@ def get_g(tau: np.ndarray, B0, alpha) -> np.ndarray:
     max_value = np.max(unnormalized_g)
     return unnormalized_g / max_value
 
+
+METRICS = ('r2', 'rmse', 'mae', 'aic', 'bic', 'cp', 'adjusted_r2')
+MAXFEV = 500
+
 class DipModel(ABC):
     def __init__(self, f: Callable, name: str=None) -> None:
         self.f = f
@@ -116,25 +121,51 @@ class DipModel(ABC):
         self.params: list[float] = []
         self.param_names = []
         self.params_err = []
+        self.cov = None
+        self.metrics: dict[str, float] = {}
         self.fitted = False
+        self.cache: FitCache | None = None
+        self.from_cache = False
 
     def __str__(self) -> str:
         return self.name
 
     def fit(self, x_data, y_data, p0:list[float] = None, bounds:tuple[list, list]=(-np.inf, np.inf)):
+        key = None
+        if self.cache is not None:
+            key = fit_key(self.f, x_data, y_data, p0, bounds, MAXFEV)
+            result = self.cache.get(key)
+            self.from_cache = result is not None
+            if result is not None:
+                logger.info(f'{self.name}: fit result from cache')
+                if result['fitted']:
+                    self._set_result(result['params'], result['cov'], result['metrics'])
+                return
         logger.info(f'trying to fit {self.name}')
         try:
-            params, cov, info, mesg, _ = curve_fit(f=self.f, xdata=x_data, ydata=y_data, maxfev=500, p0=p0, bounds=bounds, full_output=True)
+            params, cov, info, mesg, _ = curve_fit(f=self.f, xdata=x_data, ydata=y_data, maxfev=MAXFEV, p0=p0, bounds=bounds, full_output=True)
         except RuntimeError as e:
             logger.error(f'{self.name}: {e}')
+            # a fit which did not converge is cached as well, it would not converge the next time either
+            if key is not None:
+                self.cache.put(key, [], [], {}, fitted=False)
             return
         except Exception as e:
             logger.error(e)
             raise e
+        self._set_result(params, cov)
+        self.metrics = dict(zip(METRICS, self.evaluate(x_data, y_data)))
+        if key is not None:
+            self.cache.put(key, params, cov, self.metrics, fitted=True)
+        return
+
+    def _set_result(self, params, cov, metrics: dict[str, float] | None = None):
         self.fitted = True
         self.params = params
+        self.cov = cov
         self.params_err = np.sqrt(np.diag(cov))
-        return
+        if metrics is not None:
+            self.metrics = metrics
 
     def evaluate(self, x_data: ArrayLike, true_y: ArrayLike) -> tuple[float, float, float, float, float, float, float]:
         if not self.fitted:
@@ -155,7 +186,8 @@ class DipModel(ABC):
         if not self.fitted:
             logger.error(f'{self.name} not fitted. Run fit first!')
             return
-        return np.array([self.f(x, * self.params) for x in x_data])
+        # the model functions are elementwise, so the whole array is evaluated at once
+        return np.asarray(self.f(np.asarray(x_data, dtype=np.float64), *self.params))
         
     def get_fitted_function(self):
         if not self.fitted:
@@ -388,7 +420,8 @@ class SOC_RISC_Model(DipModel):
             logger.error(f'{self.name} not fitted. Run fit first!')
             return
         components = {}
-        components['isc_component'] = lambda x: self.params[0] * (x**2 / (x**2 + (self.params[3])**2))
-        components['risc_component'] = lambda x: self.params[1] (x**2 / (x**2 + (self.params[4])**2))
-        components['tca_component'] = lambda x: self.params[2] (x**2 / (abs(x) + (params[5]))**2)
+        # the terms of soc_risc, they add up to the model
+        components['isc_component'] = lambda x: lorentzian(x, self.params[0], self.params[3])
+        components['risc_component'] = lambda x: -lorentzian(x, self.params[1], self.params[4])
+        components['tca_component'] = lambda x: non_lorentzian(x, self.params[2], self.params[5])
         return components
\ No newline at end of file
@@ -0,0 +1,19 @@
+"""
+The measurement file format (.mfeb), shared with the acquisition in utils/mfe_file.py. The
+processing scripts run with this directory on the path, so they import it from here.
+As a script it exports a file to CSV:
+    python mfe_file.py data.mfeb [data.csv]
+"""
+import os
+import sys
+
+# the repository root first, so an installed top level utils package does not shadow the repo's
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.mfe_file import (MeasurementFileError, read_measurement, read_metadata, iter_chunks,  # noqa: E402
+                            write_measurement, expand_segments, calibrate, derive_columns, export_csv)
+
+__all__ = ["MeasurementFileError", "read_measurement", "read_metadata", "iter_chunks", "write_measurement",
+           "expand_segments", "calibrate", "derive_columns", "export_csv"]
+
+if __name__ == "__main__":
+    print(export_csv(*sys.argv[1:3]))
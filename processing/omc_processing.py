@@ -1,10 +1,17 @@
 import pandas as pd
 import numpy as np
 from scipy.signal import find_peaks, sosfiltfilt, iirfilter
+from mfe_file import read_measurement, expand_segments, derive_columns
+from fit_cache import FitCache
 from fitting import  DipModel, ComposedDipModel, ColeModel, DoubleColeModel, LorentzianModel, ColeLorentzianModel, SOC_RISC_Model, LorentzianNonLorentzianModel, NonLorentzianModel, DoubleLorentzianModel, DoubleNonLorentzianModel, LorentzianColeModel
 
 import os
 import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from itertools import repeat
+from log import setup_logger
 import plotly.graph_objects as go
 import yaml
 
@@ -14,6 +21,9 @@ DEFAULT_FILTER_ORDER: int = 5
 DEFAULT_FILTER_CUTOFF: int = 40
 DEFAULT_FILTER_TYPE: str = "lowpass"
 B_FIELD_RANGE = (-192, 192)
+SIGNAL_COLUMNS = ["V_Hall", "B", "OLED", "I_OLED", "I_Photo"]
+# decimals of the cryo columns, as written to data.csv
+COLUMN_DECIMALS = {"Channel": 0, "Temp": 3, "Temp_sample": 3}
 
 # Peak detection constants
 PEAK_WIDTH = 1000
@@ -27,6 +37,9 @@ TAU_POINTS = 10000
 # Config file
 CONFIG_FILE = "process_config.yaml"
 
+# Backends to fit the candidate models of a ramp concurrently
+FIT_BACKENDS = ("serial", "thread", "process")
+
 if not __name__ == "__main__":
     logger = logging.getLogger(__name__)
 
@@ -76,26 +89,83 @@ def get_change_points(df: pd.DataFrame, columns: list[str] | str) -> pd.Index:
     return pd.Index(sorted(change_indices))
 
 
-def add_ramp_idx(df: pd.DataFrame, splits: list[int]):
-    def get_ramp_idx(index):
-        for i, val in enumerate(splits):
-            if index < val:
-                return i
-        return len(splits)
+def load_measurement(path: str) -> pd.DataFrame:
+    """
+    Reads data.mfeb of a measurement directory, older measurements only have a data.csv.
+    The sample rate measured during the acquisition is available as df.attrs["sample_rate"],
+    the acquisition config as df.attrs["config"] and the rows of the ramp turns and events
+    (e.g. magnet_on) as df.attrs["ramp_turns"] and df.attrs["events"]. Columns which were
+    stored as segment tables (cryo channel and temperatures) are expanded to one value per
+    row, the tables themselves are kept in df.attrs["segments"] for get_segments. Derived
+    columns (B) are computed from their calibration.
+    """
+    file_path = f"{path}/data.mfeb"
+    if not os.path.isfile(file_path):
+        return pd.read_csv(f"{path}/data.csv", comment="#")
+    columns, metadata = read_measurement(file_path)
+    columns = {name: values.astype(np.float64) for name, values in columns.items()}
+    df = pd.DataFrame(derive_columns(columns, metadata["derived"]))
+    for key in ("sample_rate", "config", "segments", "ramp_turns", "events"):
+        if key in metadata:
+            df.attrs[key] = metadata[key]
+    for name, runs in metadata.get("segments", {}).items():
+        df[name] = expand_segments(runs, 0, len(df))
+    for name, decimals in COLUMN_DECIMALS.items():
+        if name in df:
+            df[name] = df[name].round(decimals)
+            if decimals == 0 and not df[name].isna().any():
+                df[name] = df[name].astype(int)
+    return df
+
+
+def get_segments(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    Runs of constant values of column as rows (start, end, value) of row positions, end exclusive.
+    Measurements with a segment table are looked up, for older ones the changes are detected.
+    """
+    runs = df.attrs.get("segments", {}).get(column)
+    if runs is not None:
+        runs = [(start, min(end, len(df)), value) for start, end, value in runs if start < len(df)]
+        return pd.DataFrame(runs, columns=["start", "end", "value"])
+    values = df[column].to_numpy()
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(values)]
+    return pd.DataFrame({"start": starts, "end": ends, "value": values[starts]})
+
+
+def load_measurement_config(path: str, measurement: pd.DataFrame) -> dict:
+    """The acquisition config embedded in data.mfeb, or the config.yaml next to it."""
+    if "config" in measurement.attrs:
+        return measurement.attrs["config"]
+    with open(f"{path}/config.yaml", mode="r") as f:
+        return yaml.safe_load(f)
+
 
-    df["ramp_idx"] = df.index.map(get_ramp_idx)
+def interpolate_gaps(df: pd.DataFrame, columns: list[str] = SIGNAL_COLUMNS) -> pd.DataFrame:
+    """
+    Frames lost during the acquisition are stored as NaN rows to keep the sample index aligned
+    with the time. Interpolate the signal columns linearly so the filters see a continuous signal.
+    """
+    columns = [column for column in columns if column in df]
+    n_gap_rows = int(df[columns].isna().any(axis=1).sum())
+    if n_gap_rows:
+        logger.warning(f"Interpolating {n_gap_rows} rows of lost frames")
+        df[columns] = df[columns].interpolate(limit_direction="both")
+    return df
+
+
+def add_ramp_idx(df: pd.DataFrame, splits: list[int]):
+    """ramp_idx of a row: the number of split points at or before its index"""
+    df["ramp_idx"] = np.searchsorted(np.asarray(splits), df.index.to_numpy(), side="right")
 
 
 def split_df(df: pd.DataFrame, splits: list[int] | pd.Index) -> list[pd.DataFrame]:
-    dfs = []
-    start = 0
-    for end in splits:
-        split = df.iloc[start:end].copy()
-        dfs.append(split.reset_index())
-        start = end
-    last_split = df.loc[splits[-1] :].copy()
-    dfs.append(last_split.reset_index())
-    return dfs
+    """
+    Slices of df between the split rows. The slices are views which keep the index of df,
+    reset_index (a copy) is left to the slices which are processed.
+    """
+    bounds = np.r_[0, np.asarray(splits, dtype=np.int64), len(df)]
+    return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
 
 
 def get_best_model(x, y, models: list[DipModel], score="cp"):
@@ -143,7 +213,8 @@ def get_best_model(x, y, models: list[DipModel], score="cp"):
     return best_model, best_score
 
 
-def preprocess_ramp(ramp: pd.DataFrame, config: dict):
+def preprocess_ramp(ramp: pd.DataFrame, config: dict, fs: float = SAMPLING_RATE):
+    """fs: sample rate of the measurement, an fs in the filter config takes precedence"""
     # support legacy code with 'I_OLED' column
     if "I_OLED" in ramp:
         ramp["OLED"] = ramp["I_OLED"]
@@ -153,13 +224,13 @@ def preprocess_ramp(ramp: pd.DataFrame, config: dict):
             filter_ramp,
             column="OLED",
             new_column_name="oled_filtered",
-            **config["ramp"]["oled"]["filter"],
+            **({"fs": fs} | config["ramp"]["oled"]["filter"]),
         )
         .pipe(
             filter_ramp,
             column="I_Photo",
             new_column_name="photo_filtered",
-            **config["ramp"]["photo"]["filter"],
+            **({"fs": fs} | config["ramp"]["photo"]["filter"]),
         )
         .pipe(center_dip, column="photo_filtered")
         .pipe(center_dip, column="oled_filtered")
@@ -175,7 +246,72 @@ def preprocess_ramp(ramp: pd.DataFrame, config: dict):
     return ramp
 
 
-def fit_models(x_data, y_data, models_to_use: list[str]):
+def fit_model(model: DipModel, x_data, y_data) -> DipModel:
+    model.fit(x_data=x_data, y_data=y_data)
+    return model
+
+
+_fit_executors: dict[tuple[str, int], Executor] = {}
+
+
+def in_worker_process() -> bool:
+    """
+    True in a worker of a multiprocessing.Pool or a ProcessPoolExecutor. The workers of a
+    ProcessPoolExecutor are not daemonic, so current_process().daemon does not tell.
+    """
+    return multiprocessing.parent_process() is not None
+
+
+def get_fit_executor(config: dict) -> Executor | None:
+    """
+    Executor for fit_models from executor (serial, thread or process) and n_workers of the
+    fitting config. It is created once per process and reused for all ramps, None fits serially.
+    The fits run in scipy's least_squares, which spends most of its time in NumPy/LAPACK
+    without the GIL, so threads already fit in parallel without copying the data.
+    """
+    backend = config.get("executor", "serial")
+    if backend not in FIT_BACKENDS:
+        raise ValueError(f"Unknown fit executor {backend}. Use one of {FIT_BACKENDS}")
+    if backend == "serial":
+        return None
+    if backend == "process" and in_worker_process():
+        logger.info("Already running in a pool process, fitting with threads")
+        backend = "thread"
+    n_workers = config.get("n_workers") or os.cpu_count()
+    key = (backend, n_workers)
+    if key not in _fit_executors:
+        executor_type = ThreadPoolExecutor if backend == "thread" else ProcessPoolExecutor
+        _fit_executors[key] = executor_type(n_workers)
+    return _fit_executors[key]
+
+
+def shutdown_fit_executors() -> None:
+    for executor in _fit_executors.values():
+        executor.shutdown()
+    _fit_executors.clear()
+
+
+_fit_caches: dict[tuple[str, int], FitCache] = {}
+
+
+def get_fit_cache(config: dict) -> FitCache | None:
+    """
+    FitCache of the cache section (directory, max_size_mb) of the fitting config, None if no
+    directory is configured. Like the fit executor it is created once per process.
+    """
+    cache_config = config.get("cache") or {}
+    if not cache_config.get("directory"):
+        return None
+    directory = os.path.expanduser(cache_config["directory"])
+    max_size = int(cache_config.get("max_size_mb", FitCache.DEFAULTS["max_size"] / 2**20) * 2**20)
+    key = (directory, max_size)
+    if key not in _fit_caches:
+        _fit_caches[key] = FitCache(directory, max_size)
+    return _fit_caches[key]
+
+
+def fit_models(x_data, y_data, models_to_use: list[str], executor: Executor | None = None,
+               cache: FitCache | None = None):
     models: list[DipModel] = [
         ColeModel(),
         DoubleColeModel(),
@@ -193,8 +329,21 @@ def fit_models(x_data, y_data, models_to_use: list[str]):
         logger.info(f"models to use: {models_to_use}")
         models = [model for model in models if model.name in models_to_use]
     for model in models:
-        model.fit(x_data=x_data, y_data=y_data)
-        logger.info(f"{model} is fitted: {model.fitted}")
+        model.cache = cache
+    if executor is None:
+        for model in models:
+            model.fit(x_data=x_data, y_data=y_data)
+            logger.info(f"{model} is fitted: {model.fitted}")
+    else:
+        futures = {executor.submit(fit_model, model, x_data, y_data): i for i, model in enumerate(models)}
+        for future in as_completed(futures):
+            # a process backend returns a fitted copy, it takes the place of the model in the list
+            model = models[futures[future]] = future.result()
+            logger.info(f"{model} is fitted: {model.fitted}")
+    if cache is not None:
+        # counted here, the copy of the cache of a process backend does not report back
+        for model in models:
+            cache.record(model.from_cache)
     return models
 
 
@@ -204,10 +353,9 @@ def add_model_predictions(
     if not model:
         return ramp
     if isinstance(model, ComposedDipModel):
+        B = ramp["B"].to_numpy(dtype=np.float64)
         for component_name, function in model.get_fitted_component_functions().items():
-            ramp[f"{new_column_name}_{component_name}"] = np.array(
-                [function(x) for x in ramp["B"]]
-            )
+            ramp[f"{new_column_name}_{component_name}"] = function(B)
     ramp[new_column_name] = model.predict(ramp["B"])
     return ramp
 
@@ -249,17 +397,20 @@ def calc_relative_change(
 def center_dip(
     ramp: pd.DataFrame, dip_search_range: float = 5, column: str = "photo_filtered"
 ) -> pd.DataFrame:
-    B_at_zero_idx = ramp["B"].abs().idxmin()
-    low_vals = ramp.loc[ramp["B"].abs() < dip_search_range, column]
-    if len(low_vals) == 0:
+    # row positions, the index of the ramp does not have to start at 0
+    B_abs = ramp["B"].abs().to_numpy()
+    values = ramp[column].to_numpy()
+    B_at_zero_pos = int(np.argmin(B_abs))
+    low_pos = np.flatnonzero(B_abs < dip_search_range)
+    if len(low_pos) == 0:
         logger.error(f"No values found in ramp with B < {dip_search_range}")
         return ramp
-    val_at_edge = ramp.iloc[(ramp["B"] - dip_search_range).abs().argsort()[0]][column]
-    if val_at_edge < ramp[column].iat[B_at_zero_idx]:
-        photo_extrem_idx = low_vals.idxmax()
+    val_at_edge = values[(ramp["B"] - dip_search_range).abs().argsort().iloc[0]]
+    if val_at_edge < values[B_at_zero_pos]:
+        photo_extrem_pos = low_pos[np.nanargmax(values[low_pos])]
     else:
-        photo_extrem_idx = low_vals.idxmin()
-    shift_ammount = B_at_zero_idx - photo_extrem_idx
+        photo_extrem_pos = low_pos[np.nanargmin(values[low_pos])]
+    shift_ammount = B_at_zero_pos - photo_extrem_pos
     ramp[column] = ramp[column].shift(shift_ammount)
     return ramp
 
@@ -287,13 +438,31 @@ def remove_faulty_ramps(ramps: list[pd.DataFrame]):
     return ramps
 
 
-def ramps_from_measurement(measurement: pd.DataFrame):
-    split_points = get_split_points_by_extrema(measurement)
+def get_split_points(df: pd.DataFrame, offset: int = 0) -> np.ndarray:
+    """
+    Rows of the B extrema between the ramps. Measurements with an index of the ramp turns
+    recorded during the acquisition are looked up, for older ones the extrema are detected.
+    Turns before the magnet was turned on are noise.
+    offset: row of the measurement at which df starts
+    """
+    turns = df.attrs.get("ramp_turns")
+    if turns is None:
+        return get_split_points_by_extrema(df)
+    turns = np.asarray(turns, dtype=np.int64) - offset
+    magnet_on = [row - offset for name, row in df.attrs.get("events", [])
+                 if name == "magnet_on" and 0 <= row - offset < len(df)]
+    first = magnet_on[0] if magnet_on else 0
+    return turns[(turns > first) & (turns < len(df))]
+
+
+def ramps_from_measurement(measurement: pd.DataFrame, offset: int = 0):
+    split_points = get_split_points(measurement, offset)
     add_ramp_idx(measurement, split_points)
     return split_df(measurement, split_points)
 
 
-def analyze_effect(ramp: pd.DataFrame, effect_name: str, config: dict, tau_range):
+def analyze_effect(ramp: pd.DataFrame, effect_name: str, config: dict, tau_range,
+                   executor: Executor | None = None, cache: FitCache | None = None):
     fit_info = dict()
     x_data = ramp["B"]
     y_data = ramp[f'{effect_name}_detrend']
@@ -301,7 +470,7 @@ def analyze_effect(ramp: pd.DataFrame, effect_name: str, config: dict, tau_range
     for models_to_use, model_type in zip(config["models"], ["cole", "lorentz"]):
         logger.debug(f"models to use: {models_to_use}")
         logger.info(f"analyze {effect_name}_{model_type}")
-        models = fit_models(x_data, y_data, models_to_use=models_to_use)
+        models = fit_models(x_data, y_data, models_to_use=models_to_use, executor=executor, cache=cache)
         best_model, best_model_score = get_best_model(
             x_data, y_data, models, score=config["fit_score"]
         )
@@ -332,33 +501,87 @@ def analyze_effect(ramp: pd.DataFrame, effect_name: str, config: dict, tau_range
     return fit_info, g_data
 
 
+def process_ramp(ramp: pd.DataFrame, config: dict, fs: float) -> tuple[pd.DataFrame, dict, dict, dict]:
+    """
+    Preprocesses and fits one ramp, returns the processed ramp, its fit data, its g data and the
+    hits and misses of the fit cache.
+    """
+    ramp_idx = ramp["ramp_idx"].array[0]
+    logger.info(f"Ramp idx: {ramp_idx}")
+    ramp_fit_data = {"ramp": ramp_idx}
+    tau_range = np.logspace(TAU_RANGE_START, TAU_RANGE_END, TAU_POINTS)
+    ramp_g_data = {"tau": tau_range}
+    ramp = preprocess_ramp(ramp.reset_index(), config, fs)
+    fitting_config = config["ramp"]["fitting"]
+    executor = get_fit_executor(fitting_config)
+    cache = get_fit_cache(fitting_config)
+    if cache is not None:
+        cache.reset_stats()
+    for effect_name in fitting_config["effects_to_fit"]:
+        fit_info, g_value = analyze_effect(
+            ramp,
+            effect_name=effect_name,
+            config=fitting_config[effect_name],
+            tau_range=tau_range,
+            executor=executor,
+            cache=cache,
+        )
+        ramp_g_data.update(g_value)
+        ramp_fit_data.update(fit_info)
+    return ramp, ramp_fit_data, ramp_g_data, cache.stats() if cache is not None else {}
+
+
+def create_ramp_executor(config: dict) -> ProcessPoolExecutor | None:
+    """
+    Process pool for process_ramps with n_workers of the config, None to process serially.
+    Pool processes (e.g. of processing_gui, which runs one measurement per process) do not
+    start processes of their own, there the ramps are processed serially.
+    """
+    n_workers = config.get("n_workers", 1)
+    if n_workers <= 1:
+        return None
+    if in_worker_process():
+        logger.info("Already running in a pool process, processing the ramps serially")
+        return None
+    return ProcessPoolExecutor(n_workers, initializer=setup_logger, initargs=(logging.getLogger().getEffectiveLevel(),))
+
+
+def process_ramps(ramps: list[pd.DataFrame], config: dict, fs: float,
+                  executor: ProcessPoolExecutor | None = None) -> list[tuple[pd.DataFrame, dict, dict]]:
+    """
+    process_ramp for all ramps, on the executor if given. The results are in the order of ramps,
+    the hits and misses of the fit cache are logged for the whole batch.
+    """
+    if executor is None:
+        results = [process_ramp(ramp, config, fs) for ramp in ramps]
+    else:
+        results = list(executor.map(process_ramp, ramps, repeat(config), repeat(fs)))
+    hits = sum(cache_stats.get("hits", 0) for *_, cache_stats in results)
+    misses = sum(cache_stats.get("misses", 0) for *_, cache_stats in results)
+    if hits + misses:
+        logger.info(f"fit cache: {hits} hits, {misses} misses ({hits / (hits + misses):.0%} hits)")
+    return [result[:3] for result in results]
+
+
 def process_measurement(path: str, config: dict):
     logger.info(f"process measurement from {path}")
     output_path = create_dir(path, name="processed")
-    measurement = pd.read_csv(f"{path}/data.csv", comment="#")
-    with open(f"{path}/config.yaml", mode="r") as f:
-        measurement_config = yaml.safe_load(f)
+    measurement = load_measurement(path)
+    measurement = interpolate_gaps(measurement)
+    fs = measurement.attrs.get("sample_rate", SAMPLING_RATE)
+    logger.info(f"sample rate: {fs:.2f} Hz")
+    measurement_config = load_measurement_config(path, measurement)
     config.update({'measurement':measurement_config})
     ramps = ramps_from_measurement(measurement)
     ramps = remove_faulty_ramps(ramps)
     fit_data = []
-    for ramp in ramps:
-        ramp_idx = ramp["ramp_idx"].array[0]
-        logger.info(f"Ramp idx: {ramp_idx}")
-        ramp_fit_data = {"ramp": ramp_idx}
-        tau_range = np.logspace(TAU_RANGE_START, TAU_RANGE_END, TAU_POINTS)
-        ramp_g_data = {"tau": tau_range}
-        ramp = preprocess_ramp(ramp, config)
-        fitting_config = config["ramp"]["fitting"]
-        for effect_name in fitting_config["effects_to_fit"]:
-            fit_info, g_value = analyze_effect(
-                ramp,
-                effect_name=effect_name,
-                config=fitting_config[effect_name],
-                tau_range=tau_range,
-            )
-            ramp_g_data.update(g_value)
-            ramp_fit_data.update(fit_info)
+    try:
+        with create_ramp_executor(config) or nullcontext() as executor:
+            processed = process_ramps(ramps, config, fs, executor)
+    finally:
+        shutdown_fit_executors()
+    for ramp, ramp_fit_data, ramp_g_data in processed:
+        ramp_idx = ramp_fit_data["ramp"]
         ramp_data = ramp.drop(columns=["V_Hall", "ramp_idx", "omc", "mel"])
         ramp_data.to_csv(f"{output_path}/measurements_{ramp_idx}.csv")
         pd.DataFrame(ramp_g_data).set_index("tau").to_csv(
@@ -371,15 +594,32 @@ def process_measurement(path: str, config: dict):
 def process_measurement_cryo(path: str, config: dict):
     logger.info(f"process measurement from {path}")
     output_path = create_dir(path, name="processed")
-    measurement = pd.read_csv(f"{path}/data.csv", comment="#")
-    with open(f"{path}/config.yaml", mode="r") as f:
-        measurement_config = yaml.safe_load(f)
+    measurement = load_measurement(path)
+    measurement = interpolate_gaps(measurement)
+    fs = measurement.attrs.get("sample_rate", SAMPLING_RATE)
+    logger.info(f"sample rate: {fs:.2f} Hz")
+    measurement_config = load_measurement_config(path, measurement)
     config.update({'measurement':measurement_config})
-    channel_split_points = get_change_points(measurement, columns="Channel")
-    channels = split_df(measurement, channel_split_points)
+    channel_segments = get_segments(measurement, "Channel")
+    channels = [(start, measurement.iloc[start:end].reset_index())
+                for start, end in zip(channel_segments["start"], channel_segments["end"])]
     mel_temp_dependency_dict = {}
     omc_temp_dependency_dict = {}
-    for channel in channels[1:]:
+    channel_ramps = []
+    for channel_start, channel in channels:
+        channel_idx = channel['Channel'].array[0]
+        logger.info(f'process channel {channel_idx}')
+        logger.info(f'channel_type: {type(channel)}')
+        ramps = ramps_from_measurement(channel, offset=channel_start)
+        channel_ramps.append(remove_faulty_ramps(ramps))
+    # the ramps of all channels are independent, the aggregation below keeps their order
+    try:
+        with create_ramp_executor(config) or nullcontext() as executor:
+            processed = process_ramps([ramp for ramps in channel_ramps for ramp in ramps], config, fs, executor)
+    finally:
+        shutdown_fit_executors()
+    processed = iter(processed)
+    for (channel_start, channel), ramps in zip(channels, channel_ramps):
         fit_data = []
         temp = channel['Temp_sample'].array[0]
         channel_idx = channel['Channel'].array[0]
@@ -387,29 +627,8 @@ def process_measurement_cryo(path: str, config: dict):
             mel_temp_dependency_dict[channel_idx] = {}
         if channel_idx not in omc_temp_dependency_dict:
             omc_temp_dependency_dict[channel_idx] = {}
-        logger.info(f'process channel {channel_idx}')
-        logger.info(f'channel_type: {type(channel)}')
-        ramps = ramps_from_measurement(channel)
-        ramps = remove_faulty_ramps(ramps)
-        logger.info(f"process channel {channel}")
-        for ramp in ramps:
-            logger.info(type(ramp))
-            ramp_idx = ramp["ramp_idx"].array[0]
-            logger.info(f"Ramp idx: {ramp_idx}")
-            ramp_fit_data = {"ramp": ramp_idx}
-            tau_range = np.logspace(TAU_RANGE_START, TAU_RANGE_END, TAU_POINTS)
-            ramp_g_data = {"tau": tau_range}
-            ramp = preprocess_ramp(ramp, config)
-            fitting_config = config["ramp"]["fitting"]
-            for effect_name in fitting_config["effects_to_fit"]:
-                fit_info, g_value = analyze_effect(
-                    ramp,
-                    effect_name=effect_name,
-                    config=fitting_config[effect_name],
-                    tau_range=tau_range,
-                )
-                ramp_g_data.update(g_value)
-                ramp_fit_data.update(fit_info)
+        for ramp, ramp_fit_data, ramp_g_data in (next(processed) for _ in ramps):
+            ramp_idx = ramp_fit_data["ramp"]
             fit_data.append(ramp_fit_data)
             ramp_data = ramp.drop(columns=['V_Hall', 'ramp_idx', 'omc', 'mel'])
             current_temp = ramp['Temp_sample'].array[0]
@@ -447,7 +666,6 @@ def process_measurement_cryo(path: str, config: dict):
 
 if __name__ == "__main__":
     import yaml
-    from log import setup_logger
 
     logger = setup_logger(debug_level=logging.INFO)
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -0,0 +1,344 @@
+"""
+Chunked binary measurement file (.mfeb).
+
+Layout (little endian):
+    header:  b"MFEB" | version u16 | flags u16 | json length u32 | json {"columns": [...], "dtype": "<f4",
+             "derived": {...}}
+    chunk:   b"CHNK" | n_rows u32 | codec u8 | 3 pad bytes | payload length u32 | crc32 u32 | payload
+             payload: the columns of the chunk one after another (column major)
+    trailer: b"META" | json length u32 | crc32 u32 | json metadata
+             metadata["segments"]: optional columns which are constant over long runs of samples,
+             stored as {column: [[start, end, value], ...]} (end exclusive) instead of per sample
+             metadata["derived"]: columns which are not stored but computed from a stored column
+             with a polynomial calibration, {column: {"source": ..., "coefficients": [c0, c1, ...]}}.
+             The header holds the calibration at the start of the recording, the metadata the
+             final one.
+
+Chunks are self-contained and checksummed, so a file which was not closed properly (crash,
+power loss) can be read up to its last complete chunk, see recover(). The trailer is only
+written when the measurement is finalized, it holds the acquisition metadata (sample rate,
+streams, config, ...).
+Chunk codecs:
+    CODEC_RAW:  the column bytes as they are, read memory-mapped without a copy
+    CODEC_ZLIB: the bytes of each value are transposed (all first bytes, all second bytes, ...)
+                and deflated. The transposition groups the slowly changing sign and exponent
+                bytes of the float32 samples, which makes them compress well. Lossless.
+This module only depends on numpy, so it can be used by the acquisition and the processing side
+(which imports it through processing/mfe_file.py). As a script it exports a file to CSV:
+    python -m utils.mfe_file data.mfeb [data.csv]
+"""
+import os
+import sys
+import json
+import struct
+import zlib
+import numpy as np
+
+RECORDING_SUFFIX = ".mfeb"
+MAGIC = b"MFEB"
+VERSION = 1
+CHUNK_TAG = b"CHNK"
+META_TAG = b"META"
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+_HEADER = struct.Struct("<4sHHI")
+_CHUNK = struct.Struct("<4sIB3xII")
+_META = struct.Struct("<4sII")
+
+
+class MeasurementFileError(Exception):
+    pass
+
+
+def _write_trailer(f, metadata: dict | None) -> None:
+    meta = json.dumps(metadata or {}, default=str).encode()
+    f.write(_META.pack(META_TAG, len(meta), zlib.crc32(meta)))
+    f.write(meta)
+
+
+def _shuffle(data: np.ndarray) -> bytes:
+    return data.reshape(-1).view(np.uint8).reshape(-1, data.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(raw: bytes, dtype: np.dtype) -> np.ndarray:
+    return np.frombuffer(raw, dtype=np.uint8).reshape(dtype.itemsize, -1).T.copy().view(dtype).reshape(-1)
+
+
+class MeasurementWriter:
+    """
+    compression: zlib level 1-9 of the chunks, 0 writes them raw
+    derived: calibrations of the derived columns, see the module doc
+    """
+    def __init__(self, path: str, columns: list[str], dtype="<f4", compression: int = 0,
+                 derived: dict | None = None):
+        self.path = path
+        self.columns = list(columns)
+        self.dtype = np.dtype(dtype)
+        self.compression = compression
+        self.n_rows = 0
+        self.file = open(path, "wb")
+        header = json.dumps({"columns": self.columns, "dtype": self.dtype.str, "derived": derived or {}}).encode()
+        self.file.write(_HEADER.pack(MAGIC, VERSION, 0, len(header)))
+        self.file.write(header)
+
+    def write_chunk(self, data: np.ndarray) -> None:
+        """data: (n_columns, n_rows) array"""
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        if data.shape[0] != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} columns, got {data.shape[0]}")
+        n_rows = data.shape[1]
+        if not n_rows:
+            return
+        if self.compression:
+            codec = CODEC_ZLIB
+            payload = zlib.compress(_shuffle(data), self.compression)
+        else:
+            codec = CODEC_RAW
+            payload = data.tobytes()
+        self.file.write(_CHUNK.pack(CHUNK_TAG, n_rows, codec, len(payload), zlib.crc32(payload)))
+        self.file.write(payload)
+        self.n_rows += n_rows
+
+    def flush(self, fsync: bool = False) -> None:
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self, metadata: dict | None = None) -> None:
+        if self.file.closed:
+            return
+        _write_trailer(self.file, metadata)
+        self.flush(fsync=True)
+        self.file.close()
+
+
+def _read_header(f) -> dict:
+    raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        raise MeasurementFileError("File too short")
+    magic, version, _, header_len = _HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise MeasurementFileError("Not a measurement file")
+    if version > VERSION:
+        raise MeasurementFileError(f"Unsupported file version {version}")
+    return json.loads(f.read(header_len))
+
+
+def _scan(f, verify: bool = True):
+    """
+    Yields (kind, offset, info) for all complete and valid records after the header, info of a
+    chunk is (n_rows, codec, payload length, crc32, payload). Without verify the chunk payloads
+    are skipped instead of read and checked, payload is None.
+    """
+    size = os.fstat(f.fileno()).st_size
+    while True:
+        offset = f.tell()
+        raw = f.read(_CHUNK.size)
+        if raw[:4] == META_TAG and len(raw) >= _META.size:
+            _, meta_len, crc = _META.unpack(raw[:_META.size])
+            f.seek(offset + _META.size)
+            meta = f.read(meta_len)
+            if len(meta) == meta_len and zlib.crc32(meta) == crc:
+                yield "meta", offset, json.loads(meta)
+            return
+        if len(raw) < _CHUNK.size or raw[:4] != CHUNK_TAG:
+            return
+        _, n_rows, codec, payload_len, crc = _CHUNK.unpack(raw)
+        if not verify:
+            if offset + _CHUNK.size + payload_len > size:
+                return
+            f.seek(payload_len, os.SEEK_CUR)
+            yield "chunk", offset, (n_rows, codec, payload_len, crc, None)
+            continue
+        payload = f.read(payload_len)
+        if len(payload) < payload_len or zlib.crc32(payload) != crc:
+            return
+        yield "chunk", offset, (n_rows, codec, payload_len, crc, payload)
+
+
+def _decode_chunk(n_rows: int, codec: int, payload, dtype: np.dtype, n_columns: int) -> np.ndarray:
+    """(n_columns, n_rows) array, a view of payload for raw chunks"""
+    if codec == CODEC_RAW:
+        data = np.frombuffer(payload, dtype=dtype)
+    elif codec == CODEC_ZLIB:
+        data = _unshuffle(zlib.decompress(payload), dtype)
+    else:
+        raise MeasurementFileError(f"Unknown codec {codec}")
+    return data.reshape(n_columns, n_rows)
+
+
+def iter_chunks(path: str):
+    """Yields the columns of each chunk as a dict, without loading the whole file."""
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        dtype = np.dtype(header["dtype"])
+        n_columns = len(header["columns"])
+        for kind, _, info in _scan(f):
+            if kind == "meta":
+                return
+            n_rows, codec, _, _, payload = info
+            yield dict(zip(header["columns"], _decode_chunk(n_rows, codec, payload, dtype, n_columns)))
+
+
+def read_measurement(path: str, columns: list[str] | None = None,
+                     mmap: bool = True, verify: bool = False) -> tuple[dict[str, np.ndarray], dict]:
+    """
+    Returns the stored columns (default: all) and the metadata of a measurement file (only the
+    derived calibrations if not finalized), see derive_columns. With mmap the file is
+    memory-mapped instead of read, the columns of the raw chunks are copied into one array per
+    column (only their pages are loaded), for a file with a single raw chunk they are read-only
+    views of the mapping without any copy.
+    verify: also check the crc32 of the chunks of a memory-mapped file, which loads all of it.
+    Without mmap every chunk is read and checked anyway.
+    """
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        records = list(_scan(f, verify=not mmap))
+    dtype = np.dtype(header["dtype"])
+    names = header["columns"]
+    wanted = names if columns is None else list(columns)
+    missing = set(wanted) - set(names)
+    if missing:
+        raise KeyError(f"Columns {sorted(missing)} not in {path}")
+    chunks = [(offset, info) for kind, offset, info in records if kind == "chunk"]
+    metadata = next((info for kind, _, info in records if kind == "meta"), {})
+    metadata = {"derived": header.get("derived", {})} | metadata
+    mapped = np.memmap(path, dtype=np.uint8, mode="r") if mmap and chunks else None
+    parts: dict[str, list[np.ndarray]] = {name: [] for name in wanted}
+    for offset, (n_rows, codec, payload_len, crc, payload) in chunks:
+        if payload is None:
+            start = offset + _CHUNK.size
+            payload = mapped[start:start + payload_len]
+            if verify and zlib.crc32(payload) != crc:
+                break  # like _scan: the data ends before a damaged chunk
+        data = _decode_chunk(n_rows, codec, payload, dtype, len(names))
+        for name in wanted:
+            parts[name].append(data[names.index(name)])
+    result = {}
+    for name, values in parts.items():
+        if len(values) == 1:
+            result[name] = values[0]
+        else:
+            result[name] = np.concatenate(values) if values else np.empty(0, dtype=dtype)
+    return result, metadata
+
+
+def read_metadata(path: str) -> dict:
+    """Metadata of a file without reading the data, like read_measurement."""
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        metadata = {"derived": header.get("derived", {})}
+        for kind, _, info in _scan(f, verify=False):
+            if kind == "meta":
+                return metadata | info
+    return metadata
+
+
+def recover(path: str, metadata: dict | None = None) -> int | None:
+    """
+    Truncates a file which was not closed properly after its last complete chunk and closes it
+    with metadata. Returns the number of recovered rows or None if the file was closed properly.
+    Closed files are recognized by their trailer without reading (and checking) the chunks.
+    """
+    n_rows = 0
+    with open(path, "r+b") as f:
+        _read_header(f)
+        end = f.tell()
+        if any(kind == "meta" for kind, _, _ in _scan(f, verify=False)):
+            return None
+        f.seek(end)
+        for kind, _, info in _scan(f):
+            if kind == "meta":
+                return None
+            n_rows += info[0]
+            end = f.tell()
+        f.seek(end)
+        f.truncate()
+        _write_trailer(f, metadata)
+        f.flush()
+        os.fsync(f.fileno())
+    return n_rows
+
+
+def write_measurement(path: str, columns: dict[str, np.ndarray], metadata: dict | None = None,
+                      chunk_rows: int = 1 << 18, progress=None, cancelled=None, compression: int = 0,
+                      derived: dict | None = None) -> bool:
+    """
+    Writes all columns at once. progress(fraction) is called after every chunk, if cancelled()
+    returns True the partial file is removed and False is returned.
+    """
+    names = list(columns)
+    n_rows = len(columns[names[0]]) if names else 0
+    writer = MeasurementWriter(path, names, compression=compression, derived=derived)
+    for start in range(0, n_rows, chunk_rows):
+        if cancelled and cancelled():
+            writer.file.close()
+            os.remove(path)
+            return False
+        writer.write_chunk(np.vstack([np.asarray(columns[name][start:start + chunk_rows]) for name in names]))
+        if progress:
+            progress(min(1., (start + chunk_rows) / n_rows))
+    writer.close(metadata)
+    return True
+
+
+def expand_segments(runs: list[list], start: int = 0, stop: int | None = None) -> np.ndarray:
+    """Per sample values of the rows [start, stop) of a segment table, NaN outside of its runs."""
+    if stop is None:
+        stop = max((end for _, end, _ in runs), default=start)
+    values = np.full(max(0, stop - start), np.nan)
+    for run_start, run_end, value in runs:
+        lo, hi = max(run_start, start), min(run_end, stop)
+        if lo < hi and value is not None:
+            values[lo - start:hi - start] = value
+    return values
+
+
+def calibrate(values: np.ndarray, coefficients: list[float]) -> np.ndarray:
+    """c0 + c1 * values + c2 * values**2 + ..., in the dtype of values"""
+    result = np.zeros_like(values)
+    for coefficient in reversed(coefficients):  # Horner
+        result = result * values + coefficient
+    return result
+
+
+def derive_columns(columns: dict[str, np.ndarray], derived: dict) -> dict[str, np.ndarray]:
+    """The columns with the derived columns computed from them, each after its source column."""
+    result = {}
+    for name, values in columns.items():
+        result[name] = values
+        for derived_name, calibration in derived.items():
+            if calibration["source"] == name and derived_name not in columns:
+                result[derived_name] = calibrate(values, calibration["coefficients"])
+    return result
+
+
+def export_csv(path: str, csv_path: str | None = None, formats: dict[str, str] | None = None) -> str:
+    """
+    Writes the columns of a measurement file as CSV with a header line, like the data.csv of
+    older measurements, derived and segment columns are expanded to one value per row.
+    formats: printf format per column, default "%.7g". Returns the CSV path.
+    """
+    csv_path = csv_path or os.path.splitext(path)[0] + ".csv"
+    formats = formats or {}
+    metadata = read_metadata(path)
+    segments = metadata.get("segments", {})
+    with open(csv_path, "w", newline="") as f:
+        names = None
+        row = 0
+        for chunk in iter_chunks(path):
+            n_rows = len(next(iter(chunk.values())))
+            chunk = derive_columns(chunk, metadata["derived"])
+            chunk |= {name: expand_segments(runs, row, row + n_rows) for name, runs in segments.items()}
+            row += n_rows
+            if names is None:
+                names = list(chunk)
+                f.write(",".join(names) + "\n")
+            np.savetxt(f, np.column_stack([chunk[name] for name in names]), delimiter=",",
+                       fmt=[formats.get(name, "%.7g") for name in names])
+    return csv_path
+
+
+if __name__ == "__main__":
+    print(export_csv(*sys.argv[1:3]))